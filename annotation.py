@@ -0,0 +1,167 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image, ImageColor
+
+from config import BLOCK_BORDER_THICKNESS
+
+
+# Direction each vertex moves in when a polygon is padded (top left, top right, bottom right, bottom left)
+PADDING_DIRECTIONS = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+
+
+def vertices_to_polygons(bounds, padding=0):
+    """
+        Converts many OCR bounding_box vertices into a single polygon array
+        Args:
+            bounds (list) of bounding_box dicts or vertices lists ([{"x": int, "y": int}, ...]),
+                or google.cloud.vision bounding_box objects
+            padding (int) number of pixels to pad each polygon outwards by
+        Returns numpy array of shape (number of boxes, 4, 2)
+    """
+    def get_points(bound):
+        if isinstance(bound, dict):
+            return [(v["x"], v["y"]) for v in bound["vertices"]]
+        elif hasattr(bound, "vertices"):
+            return [(v.x, v.y) for v in bound.vertices]
+        return [(v["x"], v["y"]) for v in bound]
+
+    polygons = np.array(
+        [get_points(bound) for bound in bounds],
+        dtype=float,
+    ).reshape(-1, 4, 2)
+    if padding:
+        polygons += PADDING_DIRECTIONS * padding
+    return polygons
+
+
+def boxes_to_polygons(boxes):
+    """
+        Converts many BoundingBox objects (or (x1, y1, x2, y2) tuples) into a single polygon array
+        Args: boxes (list) of BoundingBox objects or tuples
+        Returns numpy array of shape (number of boxes, 4, 2)
+    """
+    coords = np.array(
+        [
+            (box.x1, box.y1, box.x2, box.y2) if hasattr(box, "x1") else tuple(box)
+            for box in boxes
+        ],
+        dtype=float,
+    ).reshape(-1, 4)
+    x1, y1, x2, y2 = coords.T
+    return np.stack(
+        [np.stack([x1, y1], 1), np.stack([x2, y1], 1), np.stack([x2, y2], 1), np.stack([x1, y2], 1)],
+        axis=1,
+    )
+
+
+def downscale_image(image, scale=1.0):
+    """
+        Converts an image into an RGB array, optionally downscaled
+        Args:
+            image (PIL.Image or numpy array) image to convert
+            scale (float) factor to resize the image by (1.0 keeps full resolution)
+        Returns numpy array of the (resized) RGB image
+    """
+    if isinstance(image, Image.Image):
+        image = np.array(image.convert("RGB"))
+    if scale == 1.0:
+        return image.copy()
+    height, width = image.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def render_annotations(image, layers, scale=1.0, width=BLOCK_BORDER_THICKNESS):
+    """
+        Draws many polygons onto a copy of an image at once, one batched call per layer
+        Args:
+            image (PIL.Image or numpy array) image to draw on
+            layers (list) of (polygons, color) or (polygons, color, width) tuples, where
+                polygons is an array of shape (number of boxes, 4, 2) in page coordinates
+            scale (float) factor to downscale the image (and polygons) by before drawing
+            width (int) default line width, in pixels of the output image
+        Returns PIL.Image with the polygons drawn on it
+    """
+    array = downscale_image(image, scale=scale)
+    for layer in layers:
+        polygons, color = layer[:2]
+        line_width = layer[2] if len(layer) > 2 else width
+        polygons = np.asarray(polygons, dtype=float)
+        if not len(polygons):
+            continue
+        if isinstance(color, str):
+            color = ImageColor.getrgb(color)
+        points = np.round(polygons * scale).astype(np.int32)
+        cv2.polylines(array, list(points), True, tuple(color[:3]), line_width)
+    return Image.fromarray(array)
+
+
+def render_contact_sheet(thumbnails, columns=4, padding=8, background="white"):
+    """
+        Lays out many thumbnails on a single grid image
+        Args:
+            thumbnails (list) of PIL.Image thumbnails
+            columns (int) number of thumbnails per row
+            padding (int) space between thumbnails
+            background (str) color of the sheet behind the thumbnails
+        Returns PIL.Image of the contact sheet
+    """
+    if not thumbnails:
+        return None
+    columns = min(columns, len(thumbnails))
+    rows = int(np.ceil(len(thumbnails) / columns))
+    cell_width = max(thumb.width for thumb in thumbnails)
+    cell_height = max(thumb.height for thumb in thumbnails)
+    sheet = Image.new(
+        "RGB",
+        (columns * (cell_width + padding) + padding, rows * (cell_height + padding) + padding),
+        color=background,
+    )
+    for index, thumb in enumerate(thumbnails):
+        row, column = divmod(index, columns)
+        sheet.paste(
+            thumb, (padding + column * (cell_width + padding), padding + row * (cell_height + padding))
+        )
+    return sheet
+
+
+def group_results_by_page(results):
+    """
+        Groups search results (see CurriculumScanner.find_text_matches) by page, keeping page order
+        Args: results (list) of search result dicts
+        Returns OrderedDict of page number to polygon array of the results' bounds
+    """
+    pages = OrderedDict()
+    for result in results:
+        bound = result.get("bounding_box") or result.get("bounds")
+        pages.setdefault(result["page"], []).append(bound)
+    return OrderedDict(
+        (page_number, vertices_to_polygons(bounds)) for page_number, bounds in pages.items()
+    )
@@ -0,0 +1,149 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks the BoundingBoxSet set operations (and deduplication) on real bullet and dash template matches from
+the sample page, comparing them against the original nested loop implementations.
+
+Usage: python benchmarks/bench_box_sets.py [tiles]
+
+The sample page is tiled `tiles` x `tiles` times, to get as many raw hits as a dense 1200px page.
+"""
+
+import sys
+import os.path
+
+from common import ROOT_DIR, SAMPLE_PAGE, best
+
+import cv2
+import numpy as np
+
+from classes import BoundingBox, BoundingBoxSet, BoxArray
+from extraction_utils import get_response_peaks
+
+
+TEMPLATES = [("bullet", 0.8), ("dash_large", 0.6), ("dash_small", 0.55)]
+
+
+def legacy_and(set_a, set_b):
+    results = []
+    for box_a in set_a:
+        for box_b in set_b:
+            if box_a.overlap(box_b) > set_a.overlap_threshold:
+                results.append(box_a & box_b)
+    return results
+
+
+def legacy_sub(set_a, set_b):
+    results = []
+    for box_a in set_a:
+        found = False
+        for box_b in set_b:
+            if box_a.overlap(box_b) > set_a.overlap_threshold:
+                found = True
+                break
+        if not found:
+            results.append(box_a)
+    return results
+
+
+def legacy_contains(boxes, item):
+    for box in boxes:
+        if box in item and item in box:
+            return True
+    return False
+
+
+def legacy_deduplicate(boxes):
+    unique = []
+    for box in boxes:
+        if not legacy_contains(unique, box):
+            unique.append(box)
+    return unique
+
+
+def get_raw_matches(img_gray, template_name, threshold):
+    # the template matching step of extraction_utils.get_template_matches, before deduplication
+    template = cv2.imread(os.path.join(ROOT_DIR, "templates", "{}.png".format(template_name)), 0)
+    w, h = template.shape[::-1]
+    res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
+    loc = np.where(res >= threshold)
+    return BoundingBoxSet(
+        [BoundingBox(pt[0], pt[1], pt[0] + w, pt[1] + h) for pt in zip(*loc[::-1])]
+    )
+
+
+def as_coords(boxes):
+    return [(box.x1, box.y1, box.x2, box.y2) for box in boxes]
+
+
+def report(name, sizes, legacy, current):
+    print("{:<34} {:>14} legacy {:>8.4f}s   current {:>8.4f}s   speedup {:>6.1f}x".format(
+        name, sizes, legacy, current, legacy / current))
+
+
+def run(tiles=6, repeat=3):
+    img_gray = cv2.cvtColor(cv2.imread(SAMPLE_PAGE), cv2.COLOR_BGR2GRAY)
+    img_gray = np.tile(img_gray, (tiles, tiles))
+    print("page size {}x{}\n".format(*img_gray.shape[::-1]))
+
+    raw = {name: get_raw_matches(img_gray, name, threshold) for name, threshold in TEMPLATES}
+
+    for name, boxes in raw.items():
+        assert as_coords(boxes.deduplicate()) == as_coords(legacy_deduplicate(boxes))
+        report("deduplicate ({})".format(name), len(boxes),
+               best(lambda: legacy_deduplicate(boxes), repeat), best(lambda: boxes.deduplicate(), repeat))
+
+    for name_a, name_b in [("dash_large", "dash_small"), ("dash_large", "bullet"), ("dash_small", "bullet")]:
+        set_a = raw[name_a]
+        set_b = raw[name_b]
+        sizes = "{}x{}".format(len(set_a), len(set_b))
+        assert as_coords(set_a & set_b) == as_coords(legacy_and(set_a, set_b))
+        report("and ({} & {})".format(name_a, name_b), sizes,
+               best(lambda: legacy_and(set_a, set_b), repeat), best(lambda: set_a & set_b, repeat))
+        assert as_coords(set_a - set_b) == as_coords(legacy_sub(set_a, set_b))
+        report("sub ({} - {})".format(name_a, name_b), sizes,
+               best(lambda: legacy_sub(set_a, set_b), repeat), best(lambda: set_a - set_b, repeat))
+
+    # collapsing the response map directly (peaks + non-maximum suppression) instead of deduplicating
+    for name, threshold in TEMPLATES:
+        template = cv2.imread(os.path.join(ROOT_DIR, "templates", "{}.png".format(name)), 0)
+        res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
+        h, w = template.shape
+
+        def suppress():
+            xs, ys, scores = get_response_peaks(res, threshold)
+            boxes = BoxArray(np.stack([xs, ys, xs + w, ys + h], axis=1))
+            return boxes.non_maximum_suppression(scores)
+
+        boxes = raw[name]
+        report("deduplicate vs NMS ({})".format(name), "{}->{}".format(len(boxes), len(suppress())),
+               best(lambda: legacy_deduplicate(boxes), repeat), best(suppress, repeat))
+
+    print("\nresults match the legacy implementation")
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 6)
@@ -0,0 +1,142 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Micro-benchmarks for the bounding box primitives used in the extraction hot loops,
+comparing BoundingBox and BoxArray against the original dict-backed implementation.
+
+Usage: python benchmarks/bench_boxes.py [number of boxes]
+"""
+
+import sys
+
+from common import best
+
+import numpy as np
+
+from classes import BoundingBox, BoxArray
+
+
+class LegacyBoundingBox(object):
+    """ The original BoundingBox implementation, kept as a baseline to benchmark against """
+
+    def __init__(self, x1, y1, x2, y2):
+        assert x1 < x2
+        assert y1 < y2
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+
+    def area(self):
+        return (self.x2 - self.x1) * (self.y2 - self.y1)
+
+    def __and__(self, other):
+        x1 = max(self.x1, other.x1)
+        y1 = max(self.y1, other.y1)
+        x2 = min(self.x2, other.x2)
+        y2 = min(self.y2, other.y2)
+        if (x2 <= x1) or (y2 <= y1):
+            return None
+        return LegacyBoundingBox(x1, y1, x2, y2)
+
+    def overlap(self, other, axis="both"):
+        if axis == "x":
+            self = LegacyBoundingBox(self.x1, 0, self.x2, 1)
+            other = LegacyBoundingBox(other.x1, 0, other.x2, 1)
+        elif axis == "y":
+            self = LegacyBoundingBox(0, self.y1, 1, self.y2)
+            other = LegacyBoundingBox(0, other.y1, 1, other.y2)
+        intersection = self & other
+        if intersection is None:
+            return 0.0
+        intersection_area = intersection.area()
+        return intersection_area / float(self.area() + other.area() - intersection_area)
+
+    def __contains__(self, item):
+        intersection = self & item
+        if intersection is None:
+            return False
+        return item.overlap(intersection) > 0.8
+
+
+def generate_coords(count, seed=0):
+    # word-sized boxes scattered over a 1200px page
+    random = np.random.RandomState(seed)
+    x1 = random.randint(0, 1100, count)
+    y1 = random.randint(0, 1500, count)
+    widths = random.randint(5, 100, count)
+    heights = random.randint(8, 20, count)
+    return list(zip(x1.tolist(), y1.tolist(), (x1 + widths).tolist(), (y1 + heights).tolist()))
+
+
+def pairwise(boxes, func):
+    return [[func(a, b) for b in boxes] for a in boxes]
+
+
+def report(name, legacy, current):
+    print("{:<32} legacy {:>9.4f}s   current {:>9.4f}s   speedup {:>7.1f}x".format(
+        name, legacy, current, legacy / current))
+
+
+def run(count=300, repeat=3):
+    coords = generate_coords(count)
+    legacy = [LegacyBoundingBox(*c) for c in coords]
+    current = [BoundingBox(*c) for c in coords]
+    array = BoxArray(coords)
+
+    print("{} boxes ({} pairs)\n".format(count, count * count))
+
+    report("construct", best(lambda: [LegacyBoundingBox(*c) for c in coords], repeat),
+           best(lambda: [BoundingBox(*c) for c in coords], repeat))
+
+    for axis in ["both", "x", "y"]:
+        report("overlap (axis={})".format(axis),
+               best(lambda: pairwise(legacy, lambda a, b: a.overlap(b, axis=axis)), repeat),
+               best(lambda: pairwise(current, lambda a, b: a.overlap(b, axis=axis)), repeat))
+        report("BoxArray.overlap (axis={})".format(axis),
+               best(lambda: pairwise(legacy, lambda a, b: a.overlap(b, axis=axis)), repeat),
+               best(lambda: array.overlap(array, axis=axis), repeat))
+
+    report("contains",
+           best(lambda: pairwise(legacy, lambda a, b: a in b), repeat),
+           best(lambda: pairwise(current, lambda a, b: a in b), repeat))
+    report("BoxArray.contained_in",
+           best(lambda: pairwise(legacy, lambda a, b: a in b), repeat),
+           best(lambda: array.contained_in(array), repeat))
+
+    # make sure the fast paths agree with the original implementation
+    for axis in ["both", "x", "y"]:
+        expected = np.array(pairwise(legacy, lambda a, b: a.overlap(b, axis=axis)))
+        assert np.allclose(np.array(pairwise(current, lambda a, b: a.overlap(b, axis=axis))), expected)
+        assert np.allclose(array.overlap(array, axis=axis), expected)
+    expected = np.array(pairwise(legacy, lambda a, b: a in b))
+    assert (np.array(pairwise(current, lambda a, b: a in b)) == expected).all()
+    assert (array.contained_in(array) == expected).all()
+    print("\nresults match the legacy implementation")
+
+
+if __name__ == "__main__":
+    run(count=int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,110 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks bullet detection on the sample page: searching the whole page, against only searching
+the strips at the left margins of the lines and columns (see get_bullet_search_regions), and the
+template matching engine against the connected components engine (see BULLET_ENGINES).
+
+Usage: python benchmarks/bench_bullets.py [tiles]
+
+The sample page (a single column) is tiled `tiles` x `tiles` times, along with its OCR data, to
+get a page with several columns, like a full KICD page.
+"""
+
+import json
+import sys
+
+from common import SAMPLE_DATA, SAMPLE_PAGE, best, tile_page
+
+import cv2
+import numpy as np
+
+from extraction_utils import determine_column_bounding_boxes
+from extraction_utils import get_bullet_search_regions
+from extraction_utils import get_bullets_by_components
+from extraction_utils import get_bullets_by_template
+
+
+def get_search_fraction(img, regions):
+    mask = np.zeros(img.shape[:2], dtype=bool)
+    for region in regions:
+        mask[int(region.y1) : int(region.y2), int(region.x1) : int(region.x2)] = True
+    return mask.mean()
+
+
+def count_agreement(words, others, max_distance=3):
+    # words found by both engines: same text, and centers within a few pixels of each other
+    matched = 0
+    remaining = list(others)
+    for word in words:
+        x, y = word.bounding_box.center()
+        for other in remaining:
+            ox, oy = other.bounding_box.center()
+            if other.text == word.text and abs(x - ox) <= max_distance and abs(y - oy) <= max_distance:
+                remaining.remove(other)
+                matched += 1
+                break
+    return matched
+
+
+def run(tiles=4, repeat=3):
+    with open(SAMPLE_DATA, "rb") as fobj:
+        page_data = json.load(fobj)
+    img, page_data = tile_page(cv2.imread(SAMPLE_PAGE), page_data, tiles)
+    print("page size {}x{}\n".format(*img.shape[:2][::-1]))
+
+    columns = determine_column_bounding_boxes(page_data, smoothing_granularity=8, prominence=1, width=50)
+    full = get_bullets_by_template(img)
+    print("{:<28} {:>8.4f}s   {} bullets/dashes".format(
+        "whole page", best(lambda: get_bullets_by_template(img), repeat), len(full)))
+
+    as_set = lambda words: set((word.text, str(word.bounding_box)) for word in words)
+    for name, mode_columns in [("line margins", None), ("line and column margins", columns)]:
+        regions = get_bullet_search_regions(page_data, columns=mode_columns)
+        margins = get_bullets_by_template(img, regions=regions)
+        print("\n{:<28} {:>8.4f}s   {} bullets/dashes".format(
+            name, best(lambda: get_bullets_by_template(img, regions=regions), repeat), len(margins)))
+        print("{:<28} {:>8.4f}s".format(
+            "  finding the regions",
+            best(lambda: get_bullet_search_regions(page_data, columns=mode_columns), repeat)))
+        print("  {} regions cover {:.1%} of the page, {} of {} whole page matches found".format(
+            len(regions), get_search_fraction(img, regions),
+            len(as_set(full) & as_set(margins)), len(full)))
+
+    print("\nconnected components engine, against template matching in the same regions")
+    for name, regions in [
+        ("whole page", None),
+        ("line margins", get_bullet_search_regions(page_data)),
+    ]:
+        templates = get_bullets_by_template(img, regions=regions)
+        components = get_bullets_by_components(img, regions=regions)
+        print("{:<28} {:>8.4f}s   {} bullets/dashes, {} of {} template matches found".format(
+            name, best(lambda: get_bullets_by_components(img, regions=regions), repeat), len(components),
+            count_agreement(templates, components), len(templates)))
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
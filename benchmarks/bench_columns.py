@@ -0,0 +1,103 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks the word coverage profile used by determine_column_bounding_boxes to find the gaps
+between columns, against the original implementation that checked every word against a divider box
+at every x, and extracting the items of each column from a shared word table, against re-parsing
+and filtering the page's words for every column.
+
+Usage: python benchmarks/bench_columns.py [tiles]
+
+The sample page is tiled `tiles` x `tiles` times (see common.py), to get a page with several
+columns, like a full KICD page.
+"""
+
+import json
+import sys
+
+from common import SAMPLE_DATA, SAMPLE_PAGE, best, tile_page
+
+import cv2
+import numpy as np
+
+from classes import BoundingBox, BoundingBoxSet
+from classes import ItemList
+from extraction_utils import build_word_table
+from extraction_utils import determine_column_bounding_boxes
+from extraction_utils import extract_items_by_column
+from extraction_utils import extract_single_line_items_from_column
+from extraction_utils import extract_word_list
+from extraction_utils import word_coverage_profile
+
+
+def legacy_word_coverage_profile(wordboxes, start_x, end_x, height):
+    raw_intersections = np.zeros(end_x)
+    for x in range(start_x, end_x):
+        divider_box = BoundingBox(x - 1, 0, x + 1, height)
+        raw_intersections[x] = len([box for box in wordboxes if divider_box.overlap(box)])
+    return raw_intersections
+
+
+def run(tiles=4, repeat=3):
+    with open(SAMPLE_DATA, "rb") as fobj:
+        page_data = json.load(fobj)
+    img, page_data = tile_page(cv2.imread(SAMPLE_PAGE), page_data, tiles)
+    print("page size {}x{}\n".format(*img.shape[:2][::-1]))
+
+    wordboxes = BoundingBoxSet([word.bounding_box for word in extract_word_list(page_data)])
+    outer = wordboxes.get_outer_box()
+    args = (wordboxes, outer.x1, outer.x2, outer.height())
+
+    assert np.array_equal(legacy_word_coverage_profile(*args), word_coverage_profile(*args))
+    print("{:<28} {:>8.4f}s".format(
+        "legacy profile", best(lambda: legacy_word_coverage_profile(*args), repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "difference array profile", best(lambda: word_coverage_profile(*args), repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "whole column detection",
+        best(
+            lambda: determine_column_bounding_boxes(page_data, smoothing_granularity=8, prominence=1, width=50),
+            repeat,
+        )))
+
+    columns = determine_column_bounding_boxes(page_data, smoothing_granularity=8, prominence=1, width=50)
+
+    def legacy_items():
+        items = ItemList([])
+        for column_box in columns:
+            items += extract_single_line_items_from_column(page_data, column_box=column_box)
+        return items
+
+    as_text = lambda items: [str(item) for item in items]
+    assert as_text(legacy_items()) == as_text(extract_items_by_column(build_word_table(page_data), columns))
+    print("\n{:<28} {:>8.4f}s".format("items, parsing per column", best(legacy_items, repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "items, shared word table",
+        best(lambda: extract_items_by_column(build_word_table(page_data), columns), repeat)))
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
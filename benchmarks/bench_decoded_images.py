@@ -0,0 +1,87 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks loading page images through the decoded image cache (see
+preprocessing.DecodedImageCache), against decoding the PNG each time.
+
+Checks that the cached pixels are the same as the decoded ones, and that the cache stays under its
+size limit for a whole scan, with each page in its own directory like process_scan lays them out.
+
+Usage: python benchmarks/bench_decoded_images.py [pages]
+"""
+
+import os.path
+import sys
+import tempfile
+
+from common import SAMPLE_PAGE, best
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import DecodedImageCache, get_decoded_image_paths
+
+
+def write_scan(directory, pages):
+    # the sample page (a single column) tiled into a full page, once per page directory
+    page = Image.fromarray(np.tile(np.array(Image.open(SAMPLE_PAGE).convert("RGB")), (2, 4, 1)))
+    paths = []
+    for index in range(pages):
+        os.makedirs(os.path.join(directory, str(index)))
+        paths.append(os.path.join(directory, str(index), "scan-{}.png".format(index)))
+        page.save(paths[-1])
+    return paths
+
+
+def run(pages=4, repeat=3):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_scan(directory, pages)
+        decoded = np.array(Image.open(paths[0]))
+        print("page size {}x{}\n".format(*decoded.shape[:2][::-1]))
+
+        cache = DecodedImageCache()
+        assert np.array_equal(cache.load(paths[0]), decoded)
+
+        print("{:<28} {:>8.4f}s".format(
+            "decoding the png", best(lambda: np.array(Image.open(paths[0])), repeat)))
+        print("{:<28} {:>8.4f}s".format(
+            "memory-mapped", best(lambda: np.asarray(cache.load(paths[0])), repeat)))
+        cache.clear(directory)
+
+        # room for a bit more than half of the pages, spread over their own directories
+        cache = DecodedImageCache(max_bytes=decoded.nbytes * pages // 2 + decoded.nbytes // 2)
+        for path in paths:
+            cache.load(path)
+        remaining = get_decoded_image_paths(directory)
+        total = sum(os.path.getsize(path) for path in remaining)
+        print("\n{} pages loaded, {} kept in the cache ({} of {} bytes)".format(
+            pages, len(remaining), total, cache.max_bytes))
+        assert total <= cache.max_bytes
+        assert cache.get_decoded_path(paths[-1]) in remaining
+
+
+if __name__ == "__main__":
+    run(pages=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
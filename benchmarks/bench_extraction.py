@@ -0,0 +1,89 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks extracting a whole document (see kicd.extraction.extract_markdown_from_document), made
+of copies of the sample page with a blank page (as written by process_scan for pages it skips)
+in the middle, in a single process and in a pool of worker processes.
+
+Checks that the blank page extracts cleanly, and adds nothing to the document: the markdown has
+to be the same as for the document without it.
+
+Usage: python benchmarks/bench_extraction.py [pages]
+"""
+
+import json
+import shutil
+import sys
+import os.path
+import tempfile
+
+from common import SAMPLE_DATA, SAMPLE_PAGE, best
+
+from PIL import Image
+
+from kicd.extraction import extract_markdown_from_document, render_to_markdown
+from page_filter import get_blank_page_data
+from scanner import CurriculumScanner
+
+
+class SampleDocument(CurriculumScanner):
+    def __init__(self, pages):
+        self.pages = pages
+
+
+def write_blank_page(directory):
+    image = Image.open(SAMPLE_PAGE)
+    image_path = os.path.join(directory, "blank.png")
+    Image.new("RGB", image.size, "white").save(image_path)
+    data_path = os.path.join(directory, "blank_ocr.json")
+    with open(data_path, "w") as fobj:
+        json.dump(get_blank_page_data(*image.size), fobj)
+    return {"file": data_path, "image": image_path, "skipped": "blank"}
+
+
+def run(pages=4, repeat=3):
+    with tempfile.TemporaryDirectory() as directory:
+        # the column layouts get cached next to the OCR data, so it's copied to keep them out of
+        # sample_data
+        sample = {"file": os.path.join(directory, "sample_ocr.json"), "image": SAMPLE_PAGE}
+        shutil.copyfile(SAMPLE_DATA, sample["file"])
+        blank = write_blank_page(directory)
+        without_blank = SampleDocument([sample] * pages)
+        with_blank = SampleDocument([sample] * (pages // 2) + [blank] + [sample] * (pages - pages // 2))
+        expected = render_to_markdown(extract_markdown_from_document(without_blank, cache=False))
+
+        for processes in (1, 2):
+            extract = lambda: extract_markdown_from_document(
+                with_blank, cache=False, processes=processes
+            )
+            markdown = render_to_markdown(extract())
+            assert markdown == expected, "the blank page changed the extracted markdown"
+            print("{} pages and a blank page, {} process(es) {:>8.4f}s".format(
+                pages, processes, best(extract, repeat)))
+
+
+if __name__ == "__main__":
+    run(pages=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
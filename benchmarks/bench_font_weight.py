@@ -0,0 +1,107 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks simulating how dark each word of the sample page should be (see get_simulated_darkness),
+using the persisted per-glyph darkness table, against rendering every word with PIL, and measuring
+how dark the words actually are from an integral image of the page (see annotate_lines_with_font_weight),
+against enhancing and thresholding a copy of every word.
+
+Usage: python benchmarks/bench_font_weight.py [tiles]
+
+For the second part, the sample page is tiled `tiles` x `tiles` times (see common.py).
+"""
+
+import json
+import sys
+
+from common import SAMPLE_DATA, SAMPLE_PAGE, best, tile_page
+
+import cv2
+import numpy as np
+
+from extraction_utils import annotate_lines_with_font_weight
+from extraction_utils import build_word_table
+from extraction_utils import determine_column_bounding_boxes
+from extraction_utils import extract_items_by_column
+from extraction_utils import extract_word_list
+from extraction_utils import get_avg_word_darkness
+from extraction_utils import get_glyph_darkness_table
+from extraction_utils import get_simulated_darkness
+from extraction_utils import render_simulated_darkness
+
+
+def legacy_annotate_lines_with_font_weight(items, img):
+    for item in items:
+        for line in item.lines:
+            darkness = get_avg_word_darkness(line, img)
+            simulated = np.mean([get_simulated_darkness(word.text) for word in line.words])
+            weight = darkness / simulated
+            if weight <= 0 or np.isnan(weight):
+                weight = None
+            line.fontweight = weight
+
+
+def run(tiles=4, repeat=3):
+    with open(SAMPLE_DATA, "rb") as fobj:
+        page_data = json.load(fobj)
+    words = [word.text for word in extract_word_list(page_data)]
+    print("{} words\n".format(len(words)))
+
+    rendered = np.array([render_simulated_darkness(word) for word in words])
+    get_glyph_darkness_table(14, glyphs="".join(words))
+    from_table = np.array([get_simulated_darkness.__wrapped__(word) for word in words])
+    errors = np.abs(from_table - rendered) / np.maximum(rendered, 1)
+    print("relative error: mean {:.3%}, max {:.3%}\n".format(errors.mean(), errors.max()))
+
+    def memoized():
+        get_simulated_darkness.cache_clear()
+        for word in words:
+            get_simulated_darkness(word)
+
+    print("{:<28} {:>8.4f}s".format(
+        "rendering each word", best(lambda: [render_simulated_darkness(w) for w in words], repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "glyph table", best(lambda: [get_simulated_darkness.__wrapped__(w) for w in words], repeat)))
+    print("{:<28} {:>8.4f}s".format("glyph table, memoized", best(memoized, repeat)))
+
+    img, page_data = tile_page(cv2.imread(SAMPLE_PAGE), page_data, tiles)
+    columns = determine_column_bounding_boxes(page_data, smoothing_granularity=8, prominence=1, width=50)
+    items = extract_items_by_column(build_word_table(page_data), columns)
+    lines = [line for item in items for line in item.lines]
+    print("\npage size {}x{}, {} lines".format(img.shape[1], img.shape[0], len(lines)))
+
+    legacy_annotate_lines_with_font_weight(items, img)
+    expected = [line.fontweight for line in lines]
+    annotate_lines_with_font_weight(items, img)
+    assert expected == [line.fontweight for line in lines]
+    print("{:<28} {:>8.4f}s".format(
+        "word by word", best(lambda: legacy_annotate_lines_with_font_weight(items, img), repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "integral image", best(lambda: annotate_lines_with_font_weight(items, img), repeat)))
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,86 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks grouping words into lines (see cluster_words_into_lines), against the original
+implementation that compared every word against every line found so far.
+
+Usage: python benchmarks/bench_lines.py [tiles]
+
+The sample page is tiled `tiles` x `tiles` times (see common.py), and all of its words are
+clustered in one go, as for a page without column detection.
+"""
+
+import json
+import sys
+
+from common import SAMPLE_DATA, SAMPLE_PAGE, best, tile_page
+
+import cv2
+
+from extraction_utils import cluster_words_into_lines
+from extraction_utils import extract_word_list
+
+
+def legacy_cluster_words_into_lines(words):
+    clusters = []
+    for word in words:
+        cluster_i = None
+        cluster_overlap = 0.2
+        for i, cluster in enumerate(clusters):
+            overlap = word.bounding_box.overlap(cluster["box"], axis="y")
+            if overlap > cluster_overlap:
+                cluster_overlap = overlap
+                cluster_i = i
+        if cluster_i is None:
+            clusters.append({"box": word.bounding_box, "words": [word]})
+        else:
+            if word.text in ["•", "-"]:
+                continue
+            cluster = clusters[cluster_i]
+            cluster["box"] = cluster["box"] | word.bounding_box
+            cluster["words"].append(word)
+    return clusters
+
+
+def run(tiles=4, repeat=3):
+    with open(SAMPLE_DATA, "rb") as fobj:
+        page_data = json.load(fobj)
+    img, page_data = tile_page(cv2.imread(SAMPLE_PAGE), page_data, tiles)
+    words = sorted(extract_word_list(page_data), key=lambda word: word.bounding_box.x1)
+    print("page size {}x{}, {} words\n".format(img.shape[1], img.shape[0], len(words)))
+
+    as_tuples = lambda clusters: [(str(c["box"]), [id(w) for w in c["words"]]) for c in clusters]
+    expected = legacy_cluster_words_into_lines(words)
+    assert as_tuples(expected) == as_tuples(cluster_words_into_lines(words))
+    print("{} lines".format(len(expected)))
+    print("{:<28} {:>8.4f}s".format(
+        "all clusters", best(lambda: legacy_cluster_words_into_lines(words), repeat)))
+    print("{:<28} {:>8.4f}s".format(
+        "clusters by band", best(lambda: cluster_words_into_lines(words), repeat)))
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
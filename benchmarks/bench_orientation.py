@@ -0,0 +1,68 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Benchmarks estimating page orientation locally (see orientation.estimate_orientation) on the
+sample page turned by each right angle, checking that the estimate for each one is the angle it
+was turned by.
+
+Usage: python benchmarks/bench_orientation.py [tiles]
+
+The sample page (a single column) is tiled `tiles` x `tiles` times, and resized so its longest side
+is PAGE_RESOLUTION like the pages rendered from PDFs, to get a page closer to a full KICD page.
+"""
+
+import sys
+
+from common import SAMPLE_PAGE, best
+
+import numpy as np
+from PIL import Image
+
+from config import PAGE_RESOLUTION
+from orientation import estimate_orientation
+
+
+def run(tiles=2, repeat=3):
+    page = Image.fromarray(
+        np.tile(np.array(Image.open(SAMPLE_PAGE).convert("RGB")), (tiles, tiles, 1))
+    )
+    scale = PAGE_RESOLUTION / max(page.size)
+    page = np.array(page.resize((int(page.width * scale), int(page.height * scale)), Image.LANCZOS))
+    print("page size {}x{}\n".format(*page.shape[:2][::-1]))
+
+    for rotation in (0, 90, 180, 270):
+        # turned clockwise, so it needs to be turned back counter-clockwise by `rotation`
+        turned = np.rot90(page, k=-rotation // 90).copy()
+        seconds = best(lambda: estimate_orientation(turned), repeat)
+        estimated = estimate_orientation(turned)
+        print("turned {:>3}   estimated {!s:>4}   {:>8.4f}s".format(rotation, estimated, seconds))
+        assert estimated == rotation, "page turned by {} was estimated as {}".format(
+            rotation, estimated
+        )
+
+
+if __name__ == "__main__":
+    run(tiles=int(sys.argv[1]) if len(sys.argv) > 1 else 2)
@@ -0,0 +1,74 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+"""
+Helpers shared by the benchmarks. Importing this module puts the repo root on the path, so that
+the repo's modules can be imported, and makes it the working directory, since the templates are
+loaded relative to it. Import it before any of the repo's modules.
+"""
+
+import copy
+import sys
+import os.path
+import timeit
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+
+SAMPLE_PAGE = os.path.join(ROOT_DIR, "sample_data", "kicd-chem-p12.png")
+SAMPLE_DATA = os.path.join(ROOT_DIR, "sample_data", "kicd-chem-p12_ocr.json")
+
+
+def best(func, repeat=3):
+    # the fastest of the runs is the least disturbed by whatever else the machine is doing
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def tile_page(img, page_data, tiles):
+    """
+    Tiles the page image `tiles` x `tiles` times, along with its OCR data, to get a page with
+    several columns, like a full KICD page
+    """
+    height, width = img.shape[:2]
+    tiled = copy.deepcopy(page_data)
+    blocks = []
+    for row in range(tiles):
+        for column in range(tiles):
+            for block in copy.deepcopy(page_data["pages"][0]["blocks"]):
+                for obj in [block] + block["paragraphs"] + [
+                    word for paragraph in block["paragraphs"] for word in paragraph["words"]
+                ]:
+                    for vertex in obj["bounding_box"]["vertices"]:
+                        vertex["x"] += column * width
+                        vertex["y"] += row * height
+                blocks.append(block)
+    tiled["pages"][0]["blocks"] = blocks
+    tiled["pages"][0]["width"] = width * tiles
+    tiled["pages"][0]["height"] = height * tiles
+    return np.tile(img, (tiles, tiles, 1)), tiled
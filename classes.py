@@ -24,7 +24,7 @@
 ##################################################
 
 from config import BULLET_THRESHOLD
-from functools import reduce
+from functools import lru_cache, reduce
 from PIL import Image, ImageDraw
 import cv2
 import numpy as np
@@ -32,11 +32,12 @@ import re
 
 
 class BoundingBox(object):
+
+    # boxes get created by the million during extraction, so avoid a per-instance dict
+    __slots__ = ("x1", "y1", "x2", "y2")
+
     def __init__(self, x1, y1, x2, y2):
-        if x1 >= x2:
-            print(x1, y1, x2, y2)
-        assert x1 < x2
-        assert y1 < y2
+        assert x1 < x2 and y1 < y2, "invalid box: ({}, {})/({}, {})".format(x1, y1, x2, y2)
         self.x1 = x1
         self.y1 = y1
         self.x2 = x2
@@ -96,31 +97,46 @@ class BoundingBox(object):
         Calculate the Intersection over Union (IoU) of two bounding boxes.
         Adapted from: https://stackoverflow.com/questions/25349178/calculating-percentage-of-bounding-box-overlap-for-image-detector-evaluation
         """
-        assert axis in ["both", "x", "y"], "`axis` must be one of 'both', 'x', or 'y'"
-        if axis == "x":
-            self = BoundingBox(self.x1, 0, self.x2, 1)
-            other = BoundingBox(other.x1, 0, other.x2, 1)
-        elif axis == "y":
-            self = BoundingBox(0, self.y1, 1, self.y2)
-            other = BoundingBox(0, other.y1, 1, other.y2)
-
-        intersection = self & other
-        if intersection is None:
-            return 0.0
-        intersection_area = intersection.area()
+        assert axis in ("both", "x", "y"), "`axis` must be one of 'both', 'x', or 'y'"
+
+        # computed inline rather than through `&`, as this is called in the hottest loops
+        if axis == "y":
+            intersection_area = min(self.y2, other.y2) - max(self.y1, other.y1)
+            if intersection_area <= 0:
+                return 0.0
+            self_area = self.y2 - self.y1
+            other_area = other.y2 - other.y1
+        else:
+            intersection_width = min(self.x2, other.x2) - max(self.x1, other.x1)
+            if intersection_width <= 0:
+                return 0.0
+            if axis == "x":
+                intersection_area = intersection_width
+                self_area = self.x2 - self.x1
+                other_area = other.x2 - other.x1
+            else:
+                intersection_height = min(self.y2, other.y2) - max(self.y1, other.y1)
+                if intersection_height <= 0:
+                    return 0.0
+                intersection_area = intersection_width * intersection_height
+                self_area = (self.x2 - self.x1) * (self.y2 - self.y1)
+                other_area = (other.x2 - other.x1) * (other.y2 - other.y1)
 
         # compute the intersection over union by taking the intersection area and dividing it
         # by the sum of the two areas minus the intersection area
-        return intersection_area / float(self.area() + other.area() - intersection_area)
+        return intersection_area / float(self_area + other_area - intersection_area)
 
     def get_subimage(self, img):
         return img[self.y1 : self.y2, self.x1 : self.x2, :].copy()
 
     def __contains__(self, item):
-        intersection = self & item
-        if intersection is None:
+        # the intersection lies within item, so its IoU with item is just the fraction of item covered
+        intersection_width = min(self.x2, item.x2) - max(self.x1, item.x1)
+        intersection_height = min(self.y2, item.y2) - max(self.y1, item.y1)
+        if intersection_width <= 0 or intersection_height <= 0:
             return False
-        return item.overlap(intersection) > 0.8
+        item_area = (item.x2 - item.x1) * (item.y2 - item.y1)
+        return intersection_width * intersection_height / float(item_area) > 0.8
 
     def __str__(self):
         return "({}, {})/({}, {})".format(self.x1, self.y1, self.x2, self.y2)
@@ -129,6 +145,135 @@ class BoundingBox(object):
         return "<BoundingBox: {}>".format(str(self))
 
 
+class BoxArray(object):
+    """
+        Many bounding boxes stored as NumPy arrays, for computing overlaps in bulk.
+        Attributes:
+            coords: float array of shape (number of boxes, 4), holding x1, y1, x2, y2
+    """
+
+    __slots__ = ("coords",)
+
+    def __init__(self, coords):
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        return cls([(box.x1, box.y1, box.x2, box.y2) for box in boxes])
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return BoundingBox(*self.coords[index].tolist())
+        return BoxArray(self.coords[index])
+
+    def __iter__(self):
+        for coords in self.coords.tolist():
+            yield BoundingBox(*coords)
+
+    def to_boxes(self):
+        return list(self)
+
+    def areas(self, axis="both"):
+        x1, y1, x2, y2 = self.coords.T
+        if axis == "x":
+            return x2 - x1
+        elif axis == "y":
+            return y2 - y1
+        return (x2 - x1) * (y2 - y1)
+
+    def intersection(self, other, axis="both"):
+        """
+        Calculate the pairwise intersection areas (or lengths, for a single axis) of the
+        boxes in this array with those in `other`, as a matrix of shape (len(self), len(other)).
+        """
+        assert axis in ("both", "x", "y"), "`axis` must be one of 'both', 'x', or 'y'"
+        a = self.coords[:, None, :]
+        b = other.coords[None, :, :]
+        widths = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+        heights = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+        if axis == "x":
+            return widths
+        elif axis == "y":
+            return heights
+        return widths * heights
+
+    def overlap(self, other, axis="both"):
+        """
+        Calculate the pairwise Intersection over Union (IoU) of the boxes in this array with
+        those in `other`, matching BoundingBox.overlap, as a matrix of shape (len(self), len(other)).
+        """
+        intersections = self.intersection(other, axis=axis)
+        unions = self.areas(axis=axis)[:, None] + other.areas(axis=axis)[None, :] - intersections
+        return intersections / unions
+
+    def contained_in(self, other):
+        """
+        Calculate, pairwise, whether each box in this array is `in` each box of `other`
+        (matching BoundingBox.__contains__), as a boolean matrix of shape (len(self), len(other)).
+        """
+        return self.intersection(other) / self.areas()[:, None] > 0.8
+
+    def matching_pairs(self, other, predicate, chunk_size=512):
+        """
+        Find all index pairs (i, j), in row-major order, for which `predicate` (called with a
+        BoxArray from self and one from other, and returning a boolean matrix) holds. For large
+        arrays, each chunk of x-sorted boxes is only compared against the boxes in `other` whose
+        x range overlaps the chunk's, so `predicate` must only hold for pairs that intersect in x.
+        """
+        if len(self) * len(other) <= chunk_size * chunk_size:
+            return np.nonzero(predicate(self, other))
+
+        order = np.argsort(self.coords[:, 0], kind="stable")
+        other_order = np.argsort(other.coords[:, 0], kind="stable")
+        other_x1 = other.coords[other_order, 0]
+        other_x2 = other.coords[other_order, 2]
+
+        rows = [np.zeros(0, dtype=int)]
+        cols = [np.zeros(0, dtype=int)]
+        for start in range(0, len(order), chunk_size):
+            chunk = order[start : start + chunk_size]
+            coords = self.coords[chunk]
+            # candidates are the boxes starting before the chunk ends, and ending after it starts
+            end = np.searchsorted(other_x1, coords[:, 2].max(), side="left")
+            candidates = other_order[:end][other_x2[:end] > coords[:, 0].min()]
+            if not len(candidates):
+                continue
+            chunk_rows, chunk_cols = np.nonzero(
+                predicate(BoxArray(coords), BoxArray(other.coords[candidates]))
+            )
+            rows.append(chunk[chunk_rows])
+            cols.append(candidates[chunk_cols])
+
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        ordering = np.lexsort((cols, rows))
+        return rows[ordering], cols[ordering]
+
+    def non_maximum_suppression(self, scores, overlap_threshold=0.3):
+        """
+        Greedily keep the highest scoring boxes, dropping any box that overlaps (IoU) an
+        already kept box by more than `overlap_threshold`. Returns the indices of the kept
+        boxes, in their original order.
+        """
+        x1, y1, x2, y2 = self.coords.T
+        areas = self.areas()
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        keep = []
+        while len(order):
+            best = order[0]
+            keep.append(best)
+            rest = order[1:]
+            widths = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+            heights = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+            intersections = widths * heights
+            overlaps = intersections / (areas[best] + areas[rest] - intersections)
+            order = rest[overlaps <= overlap_threshold]
+        return np.sort(np.array(keep, dtype=int))
+
+
 class BoundingBoxSet(list):
     def __init__(self, *args, overlap_threshold=0.4, **kwargs):
         self.overlap_threshold = overlap_threshold
@@ -137,50 +282,82 @@ class BoundingBoxSet(list):
     def get_outer_box(self):
         return reduce(lambda a, b: a | b, self)
 
+    def get_overlapping_pairs(self, other):
+        # index pairs of boxes overlapping by more than the threshold, in the order nested loops would find them
+        other = list(other)
+        if not self or not other:
+            return [], [], other
+        threshold = self.overlap_threshold
+        boxes_a = BoxArray.from_boxes(self)
+        boxes_b = BoxArray.from_boxes(other)
+        predicate = lambda a, b: a.overlap(b) > threshold
+        if threshold < 0:  # the x range pre-filter only holds for positive overlaps
+            rows, cols = np.nonzero(predicate(boxes_a, boxes_b))
+        else:
+            rows, cols = boxes_a.matching_pairs(boxes_b, predicate)
+        return rows.tolist(), cols.tolist(), other
+
     def __and__(self, other):
         # returns the bounding boxes that are in both sets (intersection)
-        results = BoundingBoxSet(overlap_threshold=self.overlap_threshold)
-        for box_a in self:
-            for box_b in other:
-                if box_a.overlap(box_b) > self.overlap_threshold:
-                    results.append(box_a & box_b)
-        return results
+        rows, cols, other = self.get_overlapping_pairs(other)
+        return BoundingBoxSet(
+            [self[i] & other[j] for i, j in zip(rows, cols)],
+            overlap_threshold=self.overlap_threshold,
+        )
 
     def __or__(self, other):
         # returns the bounding boxes that are in either set (union)
-        results = BoundingBoxSet(overlap_threshold=self.overlap_threshold)
-        for box_a in self:
-            for box_b in other:
-                if box_a.overlap(box_b) > self.overlap_threshold:
-                    results.append(box_a & box_b)
-        return results
+        rows, cols, other = self.get_overlapping_pairs(other)
+        return BoundingBoxSet(
+            [self[i] & other[j] for i, j in zip(rows, cols)],
+            overlap_threshold=self.overlap_threshold,
+        )
 
     def __add__(self, other):
         return self | other
 
     def __sub__(self, other):
         # returns the set of boxes in self but not in other
-        results = BoundingBoxSet(overlap_threshold=self.overlap_threshold)
-        for box_a in self:
-            found = False
-            for box_b in other:
-                if box_a.overlap(box_b) > self.overlap_threshold:
-                    found = True
-                    break
-            if not found:
-                results.append(box_a)
-        return results
+        rows, _cols, other = self.get_overlapping_pairs(other)
+        found = set(rows)
+        return BoundingBoxSet(
+            [box for i, box in enumerate(self) if i not in found],
+            overlap_threshold=self.overlap_threshold,
+        )
 
     def __contains__(self, item):
+        # a single membership test stays a scalar loop: converting the whole set to a BoxArray
+        # costs more than scanning it with early exit (bulk membership is done in `deduplicate`)
         for box in self:
             if box in item and item in box:
                 return True
         return False
 
+    def non_maximum_suppression(self, scores, overlap_threshold=0.3):
+        # keep only the best scoring box out of each group of overlapping boxes
+        if not self:
+            return BoundingBoxSet([], overlap_threshold=self.overlap_threshold)
+        keep = BoxArray.from_boxes(self).non_maximum_suppression(scores, overlap_threshold)
+        return BoundingBoxSet(
+            [self[i] for i in keep.tolist()], overlap_threshold=self.overlap_threshold
+        )
+
     def deduplicate(self):
+        # keep each box unless it mutually contains a box that was kept before it
         unique = BoundingBoxSet([], overlap_threshold=self.overlap_threshold)
-        for box in self:
-            if box not in unique:
+        if not self:
+            return unique
+        rows, cols = BoxArray.from_boxes(self).matching_pairs(
+            BoxArray.from_boxes(self), lambda a, b: a.contained_in(b) & b.contained_in(a).T
+        )
+        duplicates = {}
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            if j < i:
+                duplicates.setdefault(i, []).append(j)
+        kept = set()
+        for i, box in enumerate(self):
+            if not any(j in kept for j in duplicates.get(i, [])):
+                kept.add(i)
                 unique.append(box)
         return unique
 
@@ -203,6 +380,53 @@ class Word(object):
         return '<Word: "{}" @ {}>'.format(self.text, str(self.bounding_box))
 
 
+class WordTable(object):
+    """
+        The words of a page, along with their boxes as a BoxArray, so they only need to be
+        extracted from the OCR data once and can be assigned to columns in bulk.
+        Attributes:
+            words: a list of Words
+            boxes: BoxArray holding the bounding box of each word, in the same order
+    """
+
+    __slots__ = ("words", "boxes")
+
+    def __init__(self, words, boxes=None):
+        self.words = list(words)
+        self.boxes = boxes if boxes is not None else BoxArray.from_boxes(
+            word.bounding_box for word in self.words
+        )
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __add__(self, other):
+        if not isinstance(other, WordTable):
+            other = WordTable(other)
+        return WordTable(
+            self.words + other.words,
+            BoxArray(np.concatenate([self.boxes.coords, other.boxes.coords])),
+        )
+
+    def select(self, mask):
+        # the words for which `mask` is set, keeping their order
+        return [self.words[i] for i in np.nonzero(mask)[0]]
+
+    def column_membership(self, column_boxes):
+        """
+        Whether each word is `in` each of the column boxes, as a boolean matrix of shape
+        (number of words, number of columns).
+        """
+        columns = BoxArray.from_boxes(column_boxes)
+        if not len(self) or not len(columns):
+            return np.zeros((len(self), len(columns)), dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.boxes.contained_in(columns)
+
+
 class Line(object):
     """
         Attributes:
@@ -210,30 +434,51 @@ class Line(object):
             fontweight: float representing how bold the line of text is
     """
 
-    words = None
     fontweight = None
     column_box = None
 
+    # bumped whenever the words change, so that items can tell their cached values are stale
+    _version = 0
+
     def __init__(self, words, fontweight=None, column_box=None):
         self.fontweight = fontweight
         self.words = words or []
         self.column_box = column_box
 
+    @property
+    def words(self):
+        return self._words
+
+    @words.setter
+    def words(self, words):
+        self._words = words
+        self._changed()
+
+    def _changed(self):
+        # the box and text are only computed when first needed after the words change
+        self._box = self._text = None
+        self._version += 1
+
     def add_word(self, word):
         self.words.append(word)
+        self._changed()
 
     def get_box(self):
         if not self.words:
             return None
-        return BoundingBox(
-            min(word.bounding_box.x1 for word in self.words),
-            min(word.bounding_box.y1 for word in self.words),
-            max(word.bounding_box.x2 for word in self.words),
-            max(word.bounding_box.y2 for word in self.words),
-        )
+        if self._box is None:
+            self._box = BoundingBox(
+                min(word.bounding_box.x1 for word in self.words),
+                min(word.bounding_box.y1 for word in self.words),
+                max(word.bounding_box.x2 for word in self.words),
+                max(word.bounding_box.y2 for word in self.words),
+            )
+        return self._box
 
     def get_text(self):
-        return " ".join([word.text for word in self.words])
+        if self._text is None:
+            self._text = " ".join([word.text for word in self.words])
+        return self._text
 
     def get_indentation(self, word=None, units="col_width"):
         assert self.column_box, "line must have column_box set to calculate indentation"
@@ -297,22 +542,56 @@ class Line(object):
                     )
 
 
+# spaces before closing punctuation and after opening brackets, which get removed from item text
+PUNCTUATION_SPACING_REGEX = re.compile(r" ([,.:;)])|\( ")
+
+# numbers like "1. 2. 3", which get their spaces removed
+DOTTED_NUMBER_REGEX = re.compile(r"\d+\. \d+\. \d+")
+
+
 class Item(object):
-    lines = None
-    bullet = None
     tabs = None
 
     def __init__(self, lines, bullet=None):
         self.bullet = bullet
         self.lines = lines or []
 
+    @property
+    def lines(self):
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines):
+        self._lines = lines
+        self._cache = {}
+
+    @property
+    def bullet(self):
+        return self._bullet
+
+    @bullet.setter
+    def bullet(self, bullet):
+        self._bullet = bullet
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        # cached values are only valid for the same lines, with the same words
+        stamp = tuple((id(line), line._version) for line in self._lines)
+        if key not in self._cache or self._cache[key][0] != stamp:
+            self._cache[key] = (stamp, compute())
+        return self._cache[key][1]
+
     def set_bullet(self, bullet):
         self.bullet = bullet
 
     def add_lines(self, lines):
         self.lines.extend(lines)
+        self._cache = {}
 
     def get_box(self, include_bullet=False):
+        return self._cached(("box", include_bullet), lambda: self._get_box(include_bullet))
+
+    def _get_box(self, include_bullet):
         boxes = [line.get_box() for line in self.lines]
         if include_bullet and self.bullet:
             boxes = [self.bullet.bounding_box] + boxes
@@ -334,18 +613,13 @@ class Item(object):
             return None
 
     def get_text(self, separator=" "):
+        return self._cached(("text", separator), lambda: self._get_text(separator))
+
+    def _get_text(self, separator):
         text = separator.join([line.get_text().strip() for line in self.lines])
-        text = (
-            text.replace(" ,", ",")
-            .replace(" .", ".")
-            .replace(" :", ":")
-            .replace(" ;", ";")
-            .replace("( ", "(")
-            .replace(" )", ")")
-            .lstrip(".")
-            .strip()
-        )
-        for match in re.findall(r"\d+\. \d+\. \d+", text):
+        text = PUNCTUATION_SPACING_REGEX.sub(lambda match: match.group(1) or "(", text)
+        text = text.lstrip(".").strip()
+        for match in DOTTED_NUMBER_REGEX.findall(text):
             text = text.replace(match, match.replace(" ", ""))
         return text
 
@@ -359,6 +633,16 @@ class Item(object):
         return "<Item: {} @ {}>".format(str(self), self.get_box())
 
 
+# section headers in KICD documents, which items get split on
+DEFAULT_HEADER_TEXT = [
+    "Content",
+    "Specific Objectives",
+    "Suggested Resources",
+    "Suggested Further Assessment",
+    "Notes",
+]
+
+
 class ItemList(list):
     def get_box(self, include_bullet=False):
         items = BoundingBoxSet(
@@ -372,100 +656,159 @@ class ItemList(list):
 
     def combine_lines(
         self,
-        header_text=[
-            "Content",
-            "Specific Objectives",
-            "Suggested Resources",
-            "Suggested Further Assessment",
-            "Notes",
-        ],
+        header_text=DEFAULT_HEADER_TEXT,
         factor_in_fontweight=False,
     ):
-        new_items = ItemList([])
-        current_item = Item([])
-        prev_bold = False
-        for item in self:
-            # check whether there's a bullet, or the boldness of the text changed
-            bold = (
-                (item.lines[0].fontweight > 1)
-                if factor_in_fontweight and item.lines[0].fontweight
-                else False
+        return ItemList(
+            combine_item_lines(
+                self, header_text=header_text, factor_in_fontweight=factor_in_fontweight
             )
-            has_bullet = bool(item.bullet)
-            boldness_changed = bold != prev_bold
-            if has_bullet or boldness_changed:
-                new_items.add_item(current_item)
-                current_item = Item([], bullet=item.bullet)
-            current_item.add_lines(item.lines)
-            prev_bold = bold
-        new_items.add_item(current_item)
-
-        itemlist = ItemList([item for item in new_items if item.get_text().strip()])
-
-        # split on header text
-        for i, item in list(reversed(list(enumerate(itemlist)))):
-            if len(item.lines) == 1:
-                continue
-            found = False
-            for header in header_text:
-                if header in item.get_text():
-                    section_starts = set([0, len(item.lines)])
-                    found = ""
-                    started_at = None
-                    for j, line in enumerate(item.lines):
-                        seeking = header[len(found) :].strip()
-                        if seeking.startswith(line.get_text()):
-                            if started_at is None:  # found start
-                                started_at = j
-                            found += " " + line.get_text()
-                            if found.strip() == header:  # found end
-                                section_starts.add(started_at)
-                                section_starts.add(j + 1)
-                                found = ""
-                                started_at = None
-                    section_starts = list(sorted(section_starts))
-                    new_items = []
-                    for ind in range(len(section_starts) - 1):
-                        lines = item.lines[
-                            section_starts[ind] : section_starts[ind + 1]
-                        ]
-                        if ind == 0:
-                            new_items.append(Item(lines, bullet=item.bullet))
-                        else:
-                            new_items.append(Item(lines))
-                    itemlist[i : i + 1] = new_items
-
-        return itemlist
+        )
+
+
+def combine_item_lines(
+    items, header_text=DEFAULT_HEADER_TEXT, factor_in_fontweight=False
+):
+    """
+    Combines single line items into items that span multiple lines (until the next bullet, or
+    change in boldness), and splits them again on any header text. Works as a generator, yielding
+    each combined item as soon as the next one starts, so `items` can be streamed through it.
+    """
+    current_item = Item([])
+    prev_bold = False
+    for item in items:
+        # check whether there's a bullet, or the boldness of the text changed
+        bold = (
+            (item.lines[0].fontweight > 1)
+            if factor_in_fontweight and item.lines[0].fontweight
+            else False
+        )
+        has_bullet = bool(item.bullet)
+        boldness_changed = bold != prev_bold
+        if has_bullet or boldness_changed:
+            yield from split_item_on_headers(current_item, header_text)
+            current_item = Item([], bullet=item.bullet)
+        current_item.add_lines(item.lines)
+        prev_bold = bold
+    yield from split_item_on_headers(current_item, header_text)
+
+
+class HeaderMatcher(object):
+    """
+        Finds where header phrases start and end in a sequence of line texts, for all of the headers
+        in a single pass over the lines. Headers can span several lines, each of which has to be a
+        prefix of the rest of the header. Which headers a line could start is looked up in a trie of
+        the headers, so only the headers that are already partway matched get checked one by one.
+    """
+
+    def __init__(self, headers):
+        self.headers = [header.strip() for header in headers]
+        self.trie = {"headers": set(range(len(self.headers)))}
+        for i, header in enumerate(self.headers):
+            node = self.trie
+            for char in header:
+                node = node.setdefault(char, {"headers": set()})
+                node["headers"].add(i)
+
+    def get_starting_headers(self, text):
+        # the headers that start with the text
+        node = self.trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node["headers"]
+
+    def find_section_starts(self, texts, full_text=None):
+        """
+            Args:
+                texts (list) the text of each line
+                full_text (str) text of all the lines, to only look for headers it contains [optional]
+            Returns set of indices of the lines starting a header, or following the end of one
+        """
+        allowed = set(range(len(self.headers)))
+        if full_text is not None:
+            allowed = set(i for i in allowed if self.headers[i] in full_text)
+        section_starts = set()
+        found = {}  # header -> (text matched so far, index of the line it started at)
+        for j, text in enumerate(texts):
+            for i in found.keys() | (self.get_starting_headers(text) & allowed):
+                header = self.headers[i]
+                matched, started_at = found.get(i, ("", j))
+                if matched and not header[len(matched) :].strip().startswith(text):
+                    continue
+                matched += " " + text
+                if matched.strip() == header:  # found end
+                    section_starts.update([started_at, j + 1])
+                    found.pop(i, None)
+                else:
+                    found[i] = (matched, started_at)
+        return section_starts
+
+
+@lru_cache(maxsize=None)
+def get_header_matcher(headers):
+    return HeaderMatcher(headers)
+
+
+def split_item_on_headers(item, header_text=DEFAULT_HEADER_TEXT):
+    # items without any text are dropped altogether
+    text = item.get_text() if item.lines else ""
+    if not text.strip():
+        return []
+    if len(item.lines) == 1:
+        return [item]
+
+    # look for all of the headers at once, getting the text of each line only once
+    matcher = get_header_matcher(tuple(header_text))
+    section_starts = matcher.find_section_starts(
+        [line.get_text() for line in item.lines], full_text=text
+    )
+    section_starts = sorted(section_starts | set([0, len(item.lines)]))
+    if len(section_starts) == 2:
+        return [item]
+
+    pieces = []
+    for ind in range(len(section_starts) - 1):
+        lines = item.lines[section_starts[ind] : section_starts[ind + 1]]
+        if ind == 0:
+            pieces.append(Item(lines, bullet=item.bullet))
+        else:
+            pieces.append(Item(lines))
+    return pieces
 
 
 class PageImage(np.ndarray):
+    """
+    A page image (or a view onto part of one), which can be annotated with boxes for display.
+
+    The image wraps the source array without copying it, unless `copy=True` is passed, so changes
+    to the source will show up in the PageImage. Annotations are never drawn onto the image
+    itself; they are recorded as primitives and only rendered onto a separate overlay array when
+    the annotated image is requested. When loading from a path, passing a
+    preprocessing.DecodedImageCache as `image_cache` memory-maps the decoded image instead of
+    decoding the file again.
+    """
+
+    # primitives drawn since the image was created or cleared, as (box, color, width) tuples
+    _annotations = None
 
+    # overlay with the first `_rendered_count` annotations drawn on it
     _annotated_array = None
+    _rendered_count = 0
 
     box = None
 
-    def __new__(
-        subtype,
-        source,
-        dtype=float,
-        buffer=None,
-        offset=0,
-        strides=None,
-        order=None,
-        box=None,
-    ):
-        if isinstance(source, str):
+    def __new__(subtype, source, box=None, copy=False, image_cache=None):
+        if isinstance(source, str) and image_cache is not None:
+            source = image_cache.load(source, reader="cv2")
+        elif isinstance(source, str):
             source = cv2.imread(source)
+            assert source is not None, "Could not read image"
         elif isinstance(source, Image.Image):
             source = np.array(source)
 
-        shape = source.shape
-        dtype = source.dtype
-        buffer = source.copy().data
-
-        obj = super(PageImage, subtype).__new__(
-            subtype, shape, dtype, buffer, offset, strides, order
-        )
+        obj = (np.array(source) if copy else np.asarray(source)).view(subtype)
         obj.box = box
 
         return obj
@@ -477,21 +820,36 @@ class PageImage(np.ndarray):
         # because this method sees all creation of default objects - with the __new__ constructor,
         # but also with arr.view(PageImage).
         self.box = getattr(obj, "box", None)
+        self._annotations = None
+        self._annotated_array = None
+        self._rendered_count = 0
 
-    def _initialize_annotated_array(self):
-        if not self._annotated_array is not None:
-            self._annotated_array = self.copy()
+    def _render_annotations(self):
+        """
+        Return the image with all annotations drawn on it, drawing only those added since the last
+        render. Returns the image itself when nothing has been drawn.
+        """
+        if not self._annotations:
+            return self.view(np.ndarray)
+        if self._annotated_array is None:
+            self._annotated_array = np.array(self.view(np.ndarray))
+            self._rendered_count = 0
+        for box, color, width in self._annotations[self._rendered_count :]:
+            cv2.rectangle(
+                self._annotated_array, (box.x1, box.y1), (box.x2, box.y2), color, width
+            )
+        self._rendered_count = len(self._annotations)
+        return self._annotated_array
 
     def _repr_png_(self):
-        self._initialize_annotated_array()
         return self.as_pil_image(annotated=True)._repr_png_()
 
     def clear(self):
-        self._initialize_annotated_array()
-        self._annotated_array.data = self.copy().data
+        self._annotations = None
+        self._annotated_array = None
+        self._rendered_count = 0
 
     def draw_box(self, box, color=(255, 0, 0), width=2):
-        self._initialize_annotated_array()
         if isinstance(color[0], float):
             color = tuple(map(int, np.array(color[:3]) * 255))
         if hasattr(box, "bounding_box"):
@@ -502,12 +860,14 @@ class PageImage(np.ndarray):
             box = box.get_outer_box()
         if isinstance(box, tuple):
             box = BoundingBox(*box)
-        cv2.rectangle(
-            self._annotated_array, (box.x1, box.y1), (box.x2, box.y2), color, width
-        )
+        if self._annotations is None:
+            self._annotations = []
+        self._annotations.append((box, color, width))
 
     def as_pil_image(self, full=False, annotated=False):
-        image = Image.fromarray(self._annotated_array if annotated else self)
+        image = Image.fromarray(
+            self._render_annotations() if annotated else self.view(np.ndarray)
+        )
         if self.box and not full:
             image = image.crop((self.box.x1, self.box.y1, self.box.x2, self.box.y2))
         return image
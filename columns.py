@@ -0,0 +1,281 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import hashlib
+import inspect
+import json
+import os
+
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+from classes import BoundingBox, BoundingBoxSet
+from config import COLUMN_DETECTION_THRESHOLD
+from extraction_utils import determine_column_bounding_boxes
+from file_utils import atomic_write, get_page_file_path
+
+
+# Bump these whenever the corresponding algorithm changes, so that layouts
+# persisted by an older version get recomputed instead of being served stale
+COLUMN_ALGORITHM_VERSIONS = {
+    "ranges": 1,
+    "boxes": 1,
+}
+
+
+def detect_column_ranges(page_data, threshold=COLUMN_DETECTION_THRESHOLD):
+    """
+        Detects how many columns are in the page based on the blocks' bounding boxes
+        Args:
+            page_data (dict) serialized OCR data for the page
+            threshold (int) buffer space between columns
+        Returns list of column x ranges
+    """
+
+    # Set up variables for collecting info on image
+    mins = []
+    maxes = []
+    dataset = []
+
+    # Collect starting x values for each block
+    for page in page_data["pages"]:
+        for block in page["blocks"]:
+            x0 = float(min([v["x"] for v in block["bounding_box"]["vertices"]]))
+            mins.append(x0)
+            maxes.append(max([v["x"] for v in block["bounding_box"]["vertices"]]))
+
+            # Append the point to the dataset for each paragraph to give
+            # it more weight, making sure that the point is unique as
+            # k-means needs the set of points and will remove duplicates
+            for _paragraph in block["paragraphs"]:
+                while (x0, 0) in dataset:
+                    x0 += 0.5
+                dataset.append((x0, 0))
+
+    # If the page is blank, return empty array
+    if not dataset:
+        return []
+
+    # Get clustered points
+    max_width = max(maxes)
+    column_clusters = (1, [min(mins)])
+    if len(set(dataset)) > 2:
+        sil = []
+        for k in range(2, len(set(dataset))):
+            kmeans = KMeans(n_clusters=k).fit(dataset)
+            score = silhouette_score(dataset, kmeans.labels_, metric="correlation")
+            cluster_centers = [c[0] for c in kmeans.cluster_centers_]
+            sil.append((score, cluster_centers))
+        column_clusters = next(
+            ((i + 2, s[1]) for i, s in enumerate(sil) if s[0] > 0), column_clusters
+        )
+
+    # Collect ranges based on boxes that fall into
+    ranges = []
+    if column_clusters[0] == 1:
+        ranges = [(column_clusters[1][0], max_width)]
+
+    else:
+        radius = (max_width / column_clusters[0]) / 2 + threshold
+        for starting_point in column_clusters[1]:
+            x_range = {}
+            for page in page_data["pages"]:
+                for block in page["blocks"]:
+                    x0 = min([v["x"] for v in block["bounding_box"]["vertices"]])
+                    x1 = max([v["x"] for v in block["bounding_box"]["vertices"]])
+
+                    # Get highest width of boxes that are within the radius of the starting point
+                    if (
+                        starting_point - radius <= x0
+                        and x0 <= starting_point + radius
+                        and x1 - x0 <= max_width / column_clusters[0]
+                    ):
+                        x_range["x0"] = min(x0, x_range["x0"]) if x_range.get("x0") else x0
+                        x_range["x1"] = max(x1, x_range["x1"]) if x_range.get("x1") else x1
+
+            if x_range:
+                ranges.append((x_range["x0"], x_range["x1"]))
+
+    return ranges
+
+
+def get_columns_path(ocr_path):
+    """
+        Generates the path of the column layout file stored next to the OCR data
+        Args: ocr_path (str) path to <file_id>-<page_number>_ocr.json file
+        Returns str path to <file_id>-<page_number>_columns.json file
+    """
+    return get_page_file_path(ocr_path, "_columns.json")
+
+
+def get_layout_params(algorithm, params):
+    """
+        Fills in the defaults of the algorithm's parameters that weren't passed, so that
+        changing a default (e.g. COLUMN_DETECTION_THRESHOLD in config) also changes the key
+        Args:
+            algorithm (str) one of COLUMN_ALGORITHM_VERSIONS
+            params (dict) parameters passed to the algorithm
+        Returns dict of all of the parameters the layout is computed with
+    """
+    func = detect_column_ranges if algorithm == "ranges" else determine_column_bounding_boxes
+    layout_params = {
+        name: parameter.default
+        for name, parameter in inspect.signature(func).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+        and name not in ("plot_density", "word_table")
+    }
+    layout_params.update(params)
+    return layout_params
+
+
+def get_layout_key(algorithm, params):
+    """
+        Generates the key a layout is stored under in the column layout file
+        Args:
+            algorithm (str) one of COLUMN_ALGORITHM_VERSIONS
+            params (dict) parameters passed to the algorithm
+        Returns str key, e.g. "boxes-v1-0f3c9a1e"
+    """
+    key = "{}-v{}".format(algorithm, COLUMN_ALGORITHM_VERSIONS[algorithm])
+    encoded = json.dumps(get_layout_params(algorithm, params), sort_keys=True).encode("utf-8")
+    return key + "-" + hashlib.md5(encoded).hexdigest()[:8]
+
+
+def compute_column_layout(page_data, algorithm="ranges", word_table=None, **params):
+    """
+        Runs a column detection algorithm on the page, without touching the cache
+        Args:
+            page_data (dict) serialized OCR data for the page
+            algorithm (str) "ranges" (KMeans x ranges) or "boxes" (column BoundingBoxSet)
+            word_table (WordTable) already built words of the page, for "boxes" [optional]
+            params: keyword arguments passed through to the algorithm
+        Returns list of column x ranges, or BoundingBoxSet of column boxes
+    """
+    if algorithm == "ranges":
+        return detect_column_ranges(page_data, **params)
+    elif algorithm == "boxes":
+        return determine_column_bounding_boxes(page_data, word_table=word_table, **params)
+    raise RuntimeError(
+        "Unrecognized column algorithm {} (allowed algorithms: {})".format(
+            algorithm, list(COLUMN_ALGORITHM_VERSIONS)
+        )
+    )
+
+
+def serialize_column_layout(layout, algorithm):
+    # numpy scalars (e.g. from the peak finding) aren't JSON serializable
+    def to_number(value):
+        return value.item() if hasattr(value, "item") else value
+
+    if algorithm == "boxes":
+        return [[to_number(v) for v in (box.x1, box.y1, box.x2, box.y2)] for box in layout]
+    return [[to_number(v) for v in column_range] for column_range in layout]
+
+
+def deserialize_column_layout(data, algorithm):
+    if algorithm == "boxes":
+        return BoundingBoxSet([BoundingBox(*coords) for coords in data])
+    return [tuple(column_range) for column_range in data]
+
+
+def read_column_layouts(columns_path):
+    if not os.path.exists(columns_path):
+        return {}
+    try:
+        with open(columns_path, "rb") as fobj:
+            return json.load(fobj)
+    except ValueError:
+        # e.g. left truncated by an older version, so everything just gets computed again
+        return {}
+
+
+def write_column_layout(columns_path, key, layout):
+    """
+        Adds a serialized layout to the layouts persisted for a page, merged with what's on disk
+        right before writing, so layouts other processes added in the meantime are kept
+        Returns dict of all of the page's layouts
+    """
+    layouts = read_column_layouts(columns_path)
+    layouts[key] = layout
+    encoded = json.dumps(layouts, indent=2).encode("utf-8")
+    atomic_write(columns_path, lambda fobj: fobj.write(encoded))
+    return layouts
+
+
+def clear_column_layouts(ocr_path):
+    """
+        Removes any persisted column layouts for a page, e.g. when its OCR data is rewritten
+        Args: ocr_path (str) path to the page's _ocr.json file
+        Returns None
+    """
+    columns_path = get_columns_path(ocr_path)
+    if os.path.exists(columns_path):
+        os.remove(columns_path)
+
+
+def get_column_layout(
+    ocr_path, algorithm="ranges", page_data=None, precomputed=None, word_table=None, **params
+):
+    """
+        Serves the column layout for a page, computing and persisting it only once
+        per page, algorithm version, and set of parameters
+        Args:
+            ocr_path (str) path to the page's _ocr.json file
+            algorithm (str) "ranges" (KMeans x ranges) or "boxes" (column BoundingBoxSet)
+            page_data (dict) already loaded OCR data, to avoid reading it again [optional]
+            precomputed (list) layout computed elsewhere under the same key, e.g. the
+                "columns" entry in index.json, to seed the cache with [optional]
+            word_table (WordTable) already built words of the page, for "boxes" [optional]
+            params: keyword arguments passed through to the algorithm
+        Returns list of column x ranges, or BoundingBoxSet of column boxes
+    """
+    # plots can only be shown by actually running the algorithm, so skip the cache
+    if params.pop("plot_density", False):
+        if page_data is None:
+            with open(ocr_path, "rb") as fobj:
+                page_data = json.load(fobj)
+        return compute_column_layout(
+            page_data, algorithm=algorithm, word_table=word_table, plot_density=True, **params
+        )
+
+    columns_path = get_columns_path(ocr_path)
+    key = get_layout_key(algorithm, params)
+
+    layouts = read_column_layouts(columns_path)
+    if key not in layouts:
+        if precomputed is not None:
+            layout = precomputed
+        else:
+            if page_data is None:
+                with open(ocr_path, "rb") as fobj:
+                    page_data = json.load(fobj)
+            layout = compute_column_layout(
+                page_data, algorithm=algorithm, word_table=word_table, **params
+            )
+        layouts = write_column_layout(
+            columns_path, key, serialize_column_layout(layout, algorithm)
+        )
+
+    return deserialize_column_layout(layouts[key], algorithm)
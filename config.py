@@ -109,6 +109,16 @@ CREDENTIALS_PATH = os.path.join(BASE_DIR, "credentials", "client_secret.json")
 #  - Lower = better chance of finding a string longer than this length
 ORIENTATION_DETECTION_THRESHOLD = 10
 
+# Longest side (in pixels) pages are downscaled to before estimating their orientation locally
+#  - Higher = small text is more likely to be resolved
+#  - Lower = faster estimation
+ORIENTATION_ANALYSIS_SIZE = 1000
+
+# How clear the local orientation cues need to be before the Vision API is skipped
+#  - Higher = more pages are checked with the Vision API
+#  - Lower = more pages are rotated based on the local estimate alone
+ORIENTATION_CONFIDENCE_THRESHOLD = 0.2
+
 # Buffer space between columns
 #  - Higher = more tolerant column width detection
 #  - Lower = stricter column width detection
@@ -119,6 +129,28 @@ COLUMN_DETECTION_THRESHOLD = 50
 #  - Lower = better memory usage
 PAGE_RESOLUTION = 1200
 
+# Reduced resolutions each page image is also saved in, as a fraction of PAGE_RESOLUTION
+# (used for thumbnails and previews, so they don't need to decode the full image)
+PAGE_PYRAMID_SCALES = {"full": 1.0, "half": 0.5, "thumbnail": 0.125}
+
+# Max fraction of a page's pixels that can be ink for it to be skipped as blank (not sent to OCR)
+#  - Higher = pages with a few marks (e.g. just a page number) are skipped too
+#  - Lower = only completely empty pages are skipped
+BLANK_PAGE_MAX_INK = 0.0005
+
+# Max number of differing perceptual hash bits (out of 256) for a page to be compared with an
+# earlier one as a possible duplicate
+DUPLICATE_PAGE_MAX_HASH_DISTANCE = 24
+
+# Max fraction of ink pixels that can differ for a page to reuse an earlier page's OCR data
+#  - Higher = pages that only look alike are more likely to be treated as duplicates
+#  - Lower = only pages rendered the same get their OCR data reused (e.g. divider pages that
+#    only differ by a unit number differ by about 0.2)
+DUPLICATE_PAGE_MAX_DIFFERENCE = 0.1
+
+# Longest side (in pixels) pages are downscaled to before comparing their ink
+DUPLICATE_PAGE_ANALYSIS_SIZE = 500
+
 # The line width for block borders
 BLOCK_BORDER_THICKNESS = 2
 
@@ -130,6 +162,27 @@ IMAGE_CONTRAST = 2
 # % matching characters to be included in the search results
 SEARCH_THRESHOLD = 90
 
+# Max overlap (IoU) between two template matches before the weaker one is dropped
+#  - Higher = more of the nearby (duplicate) matches are kept
+#  - Lower = nearby matches get merged more aggressively
+TEMPLATE_OVERLAP_THRESHOLD = 0.3
+
+# Font used to simulate how dark regular text should be, when estimating font weights
+SIMULATION_FONT_PATH = os.path.join(BASE_DIR, "times-new-roman.ttf")
+
+# Where the darkness of each glyph of the simulation font is stored, once computed for a font size
+GLYPH_DARKNESS_PATH = os.path.join(BASE_DIR, "times-new-roman_glyph_darkness.json")
+
+# Memory used for page images and their preprocessed versions during extraction, in bytes
+#  - Higher = fewer pages need to be reloaded and preprocessed again
+#  - Lower = better memory usage
+PAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Disk space used for decoded page images stored next to each scan's images, in bytes, per scan
+#  - Higher = fewer pages need their image files decoded again
+#  - Lower = better disk usage
+DECODED_IMAGE_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
 # Multiplier for how big a space should be to be considered a bullet
 # (bullet detected if space > average character size * threshold)
 BULLET_THRESHOLD = 2
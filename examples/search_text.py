@@ -29,38 +29,27 @@ sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 
 from scanner import CurriculumScanner
-from PIL import Image, ImageDraw
 
 
 if __name__ == '__main__':
 
   # Make sure file path is provided
   if not len(sys.argv) > 2:
-    raise RuntimeError('Usage: examples/search_text.py <filepath> <search text>')
+    raise RuntimeError('Usage: examples/search_text.py <filepath> <search text> [thumbnail scale]')
 
   # Process args
   path = sys.argv[1]
   text = sys.argv[2]
+  scale = float(sys.argv[3]) if len(sys.argv) > 3 else 0.25
 
   # Find text matches
   scanner = CurriculumScanner(path)
   results = scanner.find_text_matches(text)
 
-  # Draw a border around all of the results
-  images = {}
-  for result in results:
-    if not images.get(result['page']):
-      images[result['page']] = Image.open(scanner.data[result['page']]['image'])
-
-    image = images[result['page']]
-    draw = ImageDraw.Draw(image)
-    bounds = result['bounds']
-    draw.line([bounds[0]['x'], bounds[0]['y'],
-              bounds[1]['x'], bounds[1]['y'],
-              bounds[2]['x'], bounds[2]['y'],
-              bounds[3]['x'], bounds[3]['y'],
-              bounds[0]['x'], bounds[0]['y']], fill='yellow', width=3)
-
-  # Show the images
-  for _k, image in images.items():
-    image.show()
+  # Draw a border around all of the results, each page loaded and drawn only once,
+  # and show them as thumbnails on a single contact sheet
+  sheet = scanner.draw_search_results(results, scale=scale)
+  if sheet is None:
+    print('No matches found for "{}"'.format(text))
+  else:
+    sheet.show()
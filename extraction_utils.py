@@ -23,6 +23,11 @@
 #
 ##################################################
 
+from functools import lru_cache
+import json
+import os
+import string
+
 import cv2
 import numpy as np
 import scipy
@@ -30,28 +35,203 @@ from matplotlib import pyplot as plt
 from PIL import Image, ImageDraw, ImageFont
 from scipy.signal import argrelextrema
 
-from classes import BoundingBox, BoundingBoxSet, Word, Line, Item, ItemList
+from classes import BoundingBox, BoundingBoxSet, BoxArray, Word, WordTable, Line, Item, ItemList
+from config import GLYPH_DARKNESS_PATH
+from config import SIMULATION_FONT_PATH
+from config import TEMPLATE_OVERLAP_THRESHOLD
+from file_utils import atomic_write
+
+
+# Google Vision break types that end a line (EOL_SURE_SPACE and LINE_BREAK)
+LINE_BREAK_TYPES = [3, 5]
+
+# bump when the way glyph darkness is measured changes, so persisted tables get rebuilt
+GLYPH_DARKNESS_VERSION = 1
+
+# glyphs measured up front when a glyph darkness table is first built for a font size
+COMMON_GLYPHS = string.ascii_letters + string.digits + string.punctuation + "•–—’“”"
+
+# font size -> {glyph: darkness}
+_glyph_darkness_tables = {}
 
 
-def get_template_matches(img_rgb, template_name, threshold):
+def get_response_peaks(res, threshold):
+    # only keep the local maxima of the response map, as the pixels around each match also score highly
+    ys, xs = np.nonzero(res >= threshold)
+    scores = res[ys, xs]
+    if not len(scores):
+        return xs, ys, scores
+    height, width = res.shape
+    is_peak = np.ones(len(scores), dtype=bool)
+    for dy, dx in [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]:
+        neighbor_ys = np.minimum(np.maximum(ys + dy, 0), height - 1)
+        neighbor_xs = np.minimum(np.maximum(xs + dx, 0), width - 1)
+        is_peak &= scores >= res[neighbor_ys, neighbor_xs]
+    return xs[is_peak], ys[is_peak], scores[is_peak]
 
-    img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
+
+@lru_cache(maxsize=None)
+def load_template(template_name, scale=1.0):
     template = cv2.imread("templates/{}.png".format(template_name), 0)
-    w, h = template.shape[::-1]
+    if scale != 1.0:
+        h, w = template.shape
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        template = cv2.resize(template, size, interpolation=interpolation)
+    return template
+
+
+def match_template_at(img_gray, template, xs, ys):
+    # TM_CCOEFF_NORMED scores of the template at only the given positions, rather than the whole page
+    h, w = template.shape
+    height, width = img_gray.shape
+    windows = np.lib.stride_tricks.as_strided(
+        img_gray, shape=(height - h + 1, width - w + 1, h, w), strides=img_gray.strides * 2
+    )
+    patches = windows[ys, xs].reshape(len(ys), -1).astype(np.float64)
+    centered = template.astype(np.float64).ravel()
+    centered -= centered.mean()
+    numerator = patches @ centered
+    variance = (patches * patches).sum(axis=1) - patches.sum(axis=1) ** 2 / (h * w)
+    denominator = np.sqrt(np.clip(variance, 0, None) * (centered * centered).sum())
+    return np.where(denominator > 1e-6, numerator / np.maximum(denominator, 1e-6), 0)
+
+
+def match_template_coarse_to_fine(
+    img_gray,
+    template,
+    threshold,
+    levels=1,
+    coarse_margin=0.1,
+    max_refine_fraction=0.01,
+    min_template_size=4,
+):
+    h, w = template.shape
+    height, width = img_gray.shape
+    factor = 2 ** levels
+
+    # fall back to a single full resolution pass if the template would get too small to match on
+    if levels < 1 or min(h, w) // factor < min_template_size:
+        res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
+        return get_response_peaks(res, threshold)
+
+    # find candidate positions on a downsampled copy, with a more lenient threshold
+    coarse_img = img_gray
+    coarse_template = template
+    for _ in range(levels):
+        coarse_img = cv2.pyrDown(coarse_img)
+        coarse_template = cv2.pyrDown(coarse_template)
+    coarse_res = cv2.matchTemplate(coarse_img, coarse_template, cv2.TM_CCOEFF_NORMED)
+    coarse_xs, coarse_ys, _scores = get_response_peaks(coarse_res, threshold - coarse_margin)
+
+    # nothing there, so no need to look at the full resolution page at all
+    if not len(coarse_xs):
+        return coarse_xs, coarse_ys, np.zeros(0, np.float32)
+
+    # if the candidates are spread all over the page (e.g. dashes vs. text), scoring them one by
+    # one would cost more than matching the whole page, which OpenCV does very efficiently
+    offsets = np.arange(-factor, 2 * factor)
+    if len(coarse_xs) * len(offsets) ** 2 > max_refine_fraction * (height - h + 1) * (width - w + 1):
+        res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
+        return get_response_peaks(res, threshold)
+
+    # expand each candidate into the full resolution positions it could correspond to
+    ys = (coarse_ys[:, None, None] * factor + offsets[None, :, None]).repeat(len(offsets), 2)
+    xs = (coarse_xs[:, None, None] * factor + offsets[None, None, :]).repeat(len(offsets), 1)
+    valid = (ys >= 0) & (xs >= 0) & (ys <= height - h) & (xs <= width - w)
+    positions = np.unique(ys[valid] * width + xs[valid])
+    ys, xs = positions // width, positions % width
+    scores = match_template_at(img_gray, template, xs, ys)
+    matched = scores >= threshold
+    return xs[matched], ys[matched], scores[matched]
+
+
+def match_template_in_regions(img_gray, template, threshold, regions, levels=1):
+    # only match within the given regions (padded so that the template fits), in page coordinates;
+    # the regions are small, so they're matched directly rather than through a pyramid
+    h, w = template.shape
+    height, width = img_gray.shape
+    if regions is None:
+        return match_template_coarse_to_fine(img_gray, template, threshold, levels=levels)
+    xs, ys, scores = [np.zeros(0, int)], [np.zeros(0, int)], [np.zeros(0, np.float32)]
+    for region in regions:
+        x1 = max(int(region.x1) - w // 2, 0)
+        y1 = max(int(region.y1) - h // 2, 0)
+        x2 = min(int(region.x2) + w // 2, width)
+        y2 = min(int(region.y2) + h // 2, height)
+        if x2 - x1 < w or y2 - y1 < h:
+            continue
+        region_xs, region_ys, region_scores = match_template_coarse_to_fine(
+            img_gray[y1:y2, x1:x2], template, threshold, levels=0
+        )
+        xs.append(region_xs + x1)
+        ys.append(region_ys + y1)
+        scores.append(region_scores)
+    xs, ys, scores = np.concatenate(xs), np.concatenate(ys), np.concatenate(scores)
+
+    # regions can overlap, so drop positions that were matched more than once
+    _keys, unique = np.unique(ys * width + xs, return_index=True)
+    return xs[unique], ys[unique], scores[unique]
+
+
+def get_template_matches(
+    img,
+    template_name,
+    threshold,
+    overlap_threshold=TEMPLATE_OVERLAP_THRESHOLD,
+    scales=(1.0,),
+    pyramid_levels=1,
+    regions=None,
+):
 
-    res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
-    loc = np.where(res >= threshold)
+    img_gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    return BoundingBoxSet(
-        [BoundingBox(pt[0], pt[1], pt[0] + w, pt[1] + h) for pt in zip(*loc[::-1])]
-    ).deduplicate()
+    # match the template at each of the scales, in case the page was scanned at a different size
+    coords = [np.zeros((0, 4), int)]
+    scores = [np.zeros(0, np.float32)]
+    for scale in scales:
+        template = load_template(template_name, scale)
+        h, w = template.shape
+        xs, ys, scale_scores = match_template_in_regions(
+            img_gray, template, threshold, regions, levels=pyramid_levels
+        )
+        coords.append(np.stack([xs, ys, xs + w, ys + h], axis=1))
+        scores.append(scale_scores)
+    coords = np.concatenate(coords)
+    scores = np.concatenate(scores)
+
+    # collapse the remaining nearby matches, keeping the best scoring one of each group
+    keep = BoxArray(coords).non_maximum_suppression(scores, overlap_threshold=overlap_threshold)
+    keep = keep[np.lexsort((coords[keep, 0], coords[keep, 1]))]
+
+    return BoundingBoxSet([BoundingBox(*coords[i].tolist()) for i in keep])
 
 
-def get_bullets_by_template(img_rgb):
+def get_gray_image(img):
+    # a PreprocessedPage (see preprocessing.py) already has the grayscale image
+    if hasattr(img, "gray"):
+        return img.gray
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def get_bullets_by_template(img_rgb, scales=(1.0,), pyramid_levels=1, regions=None):
+    # convert to grayscale once, rather than once for each template
+    img_gray = get_gray_image(img_rgb)
+
     # extract by template images
-    bullets = get_template_matches(img_rgb, "bullet", 0.8)
-    dashes_large = get_template_matches(img_rgb, "dash_large", 0.6)
-    dashes_small = get_template_matches(img_rgb, "dash_small", 0.55)
+    def match(template_name, threshold):
+        return get_template_matches(
+            img_gray,
+            template_name,
+            threshold,
+            scales=scales,
+            pyramid_levels=pyramid_levels,
+            regions=regions,
+        )
+
+    bullets = match("bullet", 0.8)
+    dashes_large = match("dash_large", 0.6)
+    dashes_small = match("dash_small", 0.55)
 
     # join dash matches together, and remove things that are actually bullets
     dashes = (dashes_large + dashes_small) - bullets
@@ -62,6 +242,158 @@ def get_bullets_by_template(img_rgb):
     ]
 
 
+def get_bullets_by_components(
+    img_rgb,
+    regions=None,
+    bullet_size=(0.35, 0.9),
+    dash_height=0.35,
+    dash_width=(0.25, 1.2),
+    min_fill=0.6,
+    bullet_gap=0.6,
+    dash_gap=1.5,
+    right_gap=0.3,
+):
+    """
+    Alternative to get_bullets_by_template: binarizes the page once, and classifies the small
+    connected components (blobs of ink) by their size, aspect ratio and fill. Sizes are relative to
+    the median glyph height on the page. Bullets are solid, roughly square blobs about half the height
+    of the text, and dashes are flat blobs, both with blank space to their left and right. Returns
+    the same `Word` objects as get_bullets_by_template (with boxes of the same size, centered on the
+    blob). Stray specks of ink can look like dashes, so passing `regions` to only keep blobs found
+    in the margins of the lines (see get_bullet_search_regions) is strongly recommended.
+    """
+    if hasattr(img_rgb, "binary"):  # reuse a PreprocessedPage's binarized image
+        binary, integral = img_rgb.binary, img_rgb.binary_integral
+    else:
+        img_gray = get_gray_image(img_rgb)
+        _, binary = cv2.threshold(img_gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        integral = cv2.integral(binary)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    x, y, w, h, area = stats[1:].T  # skip the background component
+    if not len(x):
+        return []
+
+    # glyph height, ignoring specks and punctuation
+    glyphs = h[(area > 4) & (h > 2)]
+    glyph_height = np.median(glyphs) if len(glyphs) else np.median(h)
+    fill = area / (w * h)
+    aspect = w / h
+
+    # amount of ink in strips to the left and right of each component, from the integral image
+    page_height, page_width = binary.shape
+
+    def ink(x1, x2):
+        x1 = np.clip(x1, 0, page_width)
+        x2 = np.clip(x2, 0, page_width)
+        y1 = np.clip(y - 1, 0, page_height)
+        y2 = np.clip(y + h + 1, 0, page_height)
+        return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+    gap = lambda factor: int(np.ceil(factor * glyph_height))
+    clear_right = ink(x + w, x + w + gap(right_gap)) == 0
+
+    is_bullet = (
+        clear_right
+        & (ink(x - gap(bullet_gap), x) == 0)
+        & (aspect > 0.6)
+        & (aspect < 1.6)
+        & (h >= bullet_size[0] * glyph_height)
+        & (h <= bullet_size[1] * glyph_height)
+        & (fill > min_fill)
+    )
+    # at low resolutions a dash can be as little as a 2x2 blob, so it's the blank space that matters
+    is_dash = (
+        clear_right
+        & (ink(x - gap(dash_gap), x) == 0)
+        & (aspect >= 1.0)
+        & (h <= dash_height * glyph_height)
+        & (w >= dash_width[0] * glyph_height)
+        & (w <= dash_width[1] * glyph_height)
+        & (fill > min_fill)
+        & ~is_bullet
+    )
+
+    centers = np.stack([x + w / 2, y + h / 2], axis=1)
+    if regions is not None:
+        # only the few candidates need checking against the regions
+        candidates = np.nonzero(is_bullet | is_dash)[0]
+        coords = BoxArray.from_boxes(regions).coords.reshape(-1, 4)
+        cx, cy = centers[candidates, 0, None], centers[candidates, 1, None]
+        inside = (
+            (cx >= coords[:, 0]) & (cx <= coords[:, 2]) & (cy >= coords[:, 1]) & (cy <= coords[:, 3])
+        ).any(axis=1)
+        outside = candidates[~inside]
+        is_bullet[outside] = False
+        is_dash[outside] = False
+
+    # boxes the size of the templates, shrunk the same way as get_bullets_by_template shrinks them
+    def boxes(mask, template_name):
+        height, width = load_template(template_name).shape
+        for cx, cy in centers[mask][np.lexsort((centers[mask][:, 0], centers[mask][:, 1]))]:
+            x1, y1 = int(round(cx - width / 2)), int(round(cy - height / 2))
+            yield BoundingBox(x1, y1, x1 + width, y1 + height)
+
+    return [Word("•", box.shrunk(0.25)) for box in boxes(is_bullet, "bullet")] + [
+        Word("-", box.shrunk(0.2, axis="x")) for box in boxes(is_dash, "dash_small")
+    ]
+
+
+BULLET_ENGINES = {
+    "template": get_bullets_by_template,
+    "components": get_bullets_by_components,
+}
+
+
+def extract_line_boxes(page_data):
+    # OCR lines end at words followed by a line break (or the end of the paragraph)
+    for page in page_data["pages"]:
+        for block in page["blocks"]:
+            for paragraph in block["paragraphs"]:
+                line = []
+                for word in paragraph["words"]:
+                    line.append(vertices_to_bounding_box(word["bounding_box"]["vertices"]))
+                    detected_break = word["symbols"][-1]["property"]["detected_break"]
+                    if detected_break["type"] in LINE_BREAK_TYPES:
+                        yield BoundingBoxSet(line).get_outer_box()
+                        line = []
+                if line:
+                    yield BoundingBoxSet(line).get_outer_box()
+
+
+def get_bullet_search_regions(page_data, columns=None, margin=2.5, overlap=0.5):
+    """
+    Narrow strips just left of the start of each OCR line, which is the only place bullets appear
+    in KICD documents. Strips extend `margin` line heights to the left of the text and `overlap`
+    line heights into it. If column boxes are provided, lines indented further than that from their
+    column also get a strip at the column's left edge. Strips of consecutive lines at about the same
+    indentation get merged, so that they can be searched in one go.
+    """
+    strips = []
+    for line in extract_line_boxes(page_data):
+        height = line.height()
+        starts = [line.x1]
+        for column in columns or []:
+            if line in column and line.x1 - column.x1 > margin * height:
+                starts.append(column.x1)
+        for x in starts:
+            strips.append(BoundingBox(max(x - margin * height, 0), line.y1, x + overlap * height, line.y2))
+
+    # sweep down the page, only comparing against regions that reach close enough to the strip
+    regions = BoundingBoxSet([])
+    active = []
+    for strip in sorted(strips, key=lambda strip: (strip.y1, strip.x1)):
+        gap = strip.height()
+        active = [i for i in active if regions[i].y2 >= strip.y1 - gap]
+        for i in active:
+            if strip.overlap(regions[i], axis="x") > 0.8:
+                regions[i] = regions[i] | strip
+                break
+        else:
+            active.append(len(regions))
+            regions.append(strip)
+    return regions
+
+
 def vertices_to_bounding_box(vertices):
     x1 = min(v["x"] for v in vertices)
     y1 = min(v["y"] for v in vertices)
@@ -82,43 +414,109 @@ def extract_word_list(page_data):
                     )
 
 
-def extract_single_line_items_from_column(page_data, column_box=None, bullets=[]):
+def build_word_table(page_data):
+    # the words on the page, extracted from the OCR data once so they can be shared between steps
+    return WordTable(extract_word_list(page_data))
 
-    # extract all the words in the page
-    words = list(extract_word_list(page_data)) + bullets
 
-    # excluding any that aren't in the column, if box was provided
-    if column_box:
-        words = [word for word in words if word.bounding_box in column_box]
-
-    # build up a list of the clusters as we find them
-    clusters = []
+def extract_items_by_column(word_table, column_boxes):
+    """
+    Runs extract_single_line_items_from_column for each of the columns, assigning the words in
+    the table (e.g. the page's words plus its bullets) to the columns in a single pass.
+    """
+    membership = word_table.column_membership(column_boxes)
+    items = ItemList([])
+    for i, column_box in enumerate(column_boxes):
+        items += extract_single_line_items_from_column(
+            None, column_box=column_box, words=word_table.select(membership[:, i])
+        )
+    return items
 
-    # sort words by leftmost X value, so that we seed the initial clusters with vertical diversity
-    words = sorted(words, key=lambda word: word.bounding_box.x1)
 
-    # loop over the words and add them one by one to the best cluster, or create a new cluster
+def cluster_words_into_lines(words, min_overlap=0.2):
+    """
+    Adds the words one by one to the cluster they overlap the most vertically (by more than
+    `min_overlap`), or starts a new cluster. Rather than comparing each word against every cluster,
+    clusters are indexed by the horizontal bands (about a line high) their y range touches, and only
+    the clusters in the bands of the word's y range are compared, in the order they were created.
+    Returns the clusters, as dicts with the "box" around and the "words" in each.
+    """
+    if not words:
+        return []
+    band_height = max(float(np.median([word.bounding_box.height() for word in words])), 1.0)
+
+    def bands(y1, y2):
+        return range(int(y1 // band_height), int(y2 // band_height) + 1)
+
+    clusters = []  # x1, y1, x2, y2 of each cluster, updated in place rather than allocating boxes
+    cluster_words = []
+    clusters_by_band = {}
     for word in words:
-        # keep track of the most overlapping cluster, ignoring any with < 0.1 overlap
-        cluster_i = None
-        cluster_overlap = 0.2
+        box = word.bounding_box
+        candidates = set()
+        for band in bands(box.y1, box.y2):
+            candidates.update(clusters_by_band.get(band, ()))
 
-        # loop over the existing clusters to find the one with the most overlap
-        for i, cluster in enumerate(clusters):
-            overlap = word.bounding_box.overlap(cluster["box"], axis="y")
+        # find the cluster with the most overlap (the same y IoU as BoundingBox.overlap)
+        cluster_i = None
+        cluster_overlap = min_overlap
+        for i in sorted(candidates):
+            cluster = clusters[i]
+            intersection = min(box.y2, cluster[3]) - max(box.y1, cluster[1])
+            if intersection <= 0:
+                continue
+            union = (box.y2 - box.y1) + (cluster[3] - cluster[1]) - intersection
+            overlap = intersection / float(union)
             if overlap > cluster_overlap:
                 cluster_overlap = overlap
                 cluster_i = i
 
         if cluster_i is None:  # if no overlapping cluster was found, create a new one
-            clusters.append({"box": word.bounding_box, "words": [word]})
+            cluster_i = len(clusters)
+            clusters.append([box.x1, box.y1, box.x2, box.y2])
+            cluster_words.append([word])
         else:  # if we found the cluster with the largest overlap, add to that
             # bullets should only be the starts of clusters, so toss false positives
             if word.text in ["•", "-"]:
                 continue
             cluster = clusters[cluster_i]
-            cluster["box"] = cluster["box"] | word.bounding_box
-            cluster["words"].append(word)
+            grew = box.y1 < cluster[1] or box.y2 > cluster[3]
+            cluster[:] = [
+                min(cluster[0], box.x1),
+                min(cluster[1], box.y1),
+                max(cluster[2], box.x2),
+                max(cluster[3], box.y2),
+            ]
+            cluster_words[cluster_i].append(word)
+            if not grew:
+                continue
+
+        # (re-)index the cluster under the bands its y range now touches
+        for band in bands(clusters[cluster_i][1], clusters[cluster_i][3]):
+            clusters_by_band.setdefault(band, set()).add(cluster_i)
+
+    return [
+        {"box": BoundingBox(*cluster), "words": cluster_words[i]}
+        for i, cluster in enumerate(clusters)
+    ]
+
+
+def extract_single_line_items_from_column(page_data, column_box=None, bullets=[], words=None):
+
+    # the words in the column may already have been looked up (see extract_items_by_column)
+    if words is None:
+        # extract all the words in the page
+        words = list(extract_word_list(page_data)) + bullets
+
+        # excluding any that aren't in the column, if box was provided
+        if column_box:
+            words = [word for word in words if word.bounding_box in column_box]
+
+    # sort words by leftmost X value, so that we seed the initial clusters with vertical diversity
+    words = sorted(words, key=lambda word: word.bounding_box.x1)
+
+    # group the words into clusters (lines) by vertical overlap
+    clusters = cluster_words_into_lines(words)
 
     # sort the clusters (lines) by top Y value to put them in sequential order
     clusters = sorted(clusters, key=lambda cluster: cluster["box"].y1)
@@ -158,15 +556,39 @@ def smooth(x, window_len):
     return y
 
 
+def word_coverage_profile(wordboxes, start_x, end_x, height):
+    if not isinstance(wordboxes, BoxArray):
+        wordboxes = BoxArray.from_boxes(wordboxes)
+    coords = wordboxes.coords.reshape(-1, 4)
+    x1, y1, x2, y2 = coords.T
+
+    # words have to overlap the divider vertically, and have some width to overlap it at all
+    hit = (np.minimum(y2, height) > np.maximum(y1, 0)) & (x2 > x1)
+
+    # a divider at x overlaps a word when x - 1 < x2 and x + 1 > x1, i.e. for x1 - 1 < x < x2 + 1
+    first = np.maximum(np.floor(x1[hit] - 1) + 1, start_x).astype(int)
+    last = np.minimum(np.ceil(x2[hit] + 1) - 1, end_x - 1).astype(int)
+    valid = first <= last
+    changes = np.zeros(max(end_x, 0) + 1)
+    np.add.at(changes, first[valid], 1)
+    np.add.at(changes, last[valid] + 1, -1)
+    return np.cumsum(changes)[:-1]
+
+
 def determine_column_bounding_boxes(
     page_data,
     smoothing_granularity=6,
     plot_density=False,
     left_shift_fraction=0.01,
+    word_table=None,
     **kwargs
 ):
-    words = list(extract_word_list(page_data))
-    wordboxes = BoundingBoxSet([word.bounding_box for word in words])
+    if word_table is None:
+        word_table = build_word_table(page_data)
+    wordboxes = BoundingBoxSet([word.bounding_box for word in word_table])
+    # blank pages have no columns
+    if not wordboxes:
+        return BoundingBoxSet([])
     outer = wordboxes.get_outer_box()
 
     page_width = page_data["pages"][0]["width"]
@@ -175,13 +597,10 @@ def determine_column_bounding_boxes(
     start_x = outer.x1
     end_x = outer.x2
 
-    # scan with vertical boxes across the page, counting the number of intersected words
-    raw_intersections = np.zeros(outer.x2)
-    for x in range(start_x, end_x):
-        divider_box = BoundingBox(x - 1, 0, x + 1, height)
-        raw_intersections[x] = len(
-            [box for box in wordboxes if divider_box.overlap(box)]
-        )
+    # count the number of words intersected by a vertical divider (from x - 1 to x + 1, and 0 to
+    # `height`) at each x, by adding up the x ranges each word is intersected over with a
+    # difference array, rather than checking every word against a divider at every x
+    raw_intersections = word_coverage_profile(word_table.boxes, start_x, end_x, height)
 
     # smooth out the resulting curve, in order to be able to search for minima
     window_len = int(width / smoothing_granularity)
@@ -215,16 +634,13 @@ def determine_column_bounding_boxes(
         block for block in blocks if not any([block in col for col in columnboxes])
     ]
 
+    # only include words that are in the column and not in a lone block
+    in_column = word_table.column_membership(columnboxes)
+    in_lone_block = word_table.column_membership(lone_blocks).any(axis=1)
     columns = BoundingBoxSet([])
-    for columnbox in columnboxes:
-        columnwords = BoundingBoxSet([])
-        for wordbox in wordboxes:
-            # only include words that are in the column and not in a lone block
-            if wordbox in columnbox and not any(
-                [wordbox in lone_block for lone_block in lone_blocks]
-            ):
-                columnwords.append(wordbox)
-        columns.append(columnwords.get_outer_box())
+    for i in range(len(columnboxes)):
+        columnwords = word_table.select(in_column[:, i] & ~in_lone_block)
+        columns.append(BoundingBoxSet([word.bounding_box for word in columnwords]).get_outer_box())
 
     if plot_density:
         plt.rcParams["figure.figsize"] = (17, 2)
@@ -298,16 +714,67 @@ def calculate_total_darkness(img, threshold=0.7):
 def render_text_box_to_img(text, fontsize=14):
     img = Image.new("RGB", (1000, 50), color=(255, 255, 255))
     d = ImageDraw.Draw(img)
-    font = ImageFont.truetype("times-new-roman.ttf", fontsize)
+    font = ImageFont.truetype(SIMULATION_FONT_PATH, fontsize)
     d.text((0, 0), text, font=font, fill=(0, 0, 0))
     return img
 
 
-def get_simulated_darkness(text, fontsize=14):
+def render_simulated_darkness(text, fontsize=14):
     img = render_text_box_to_img(text, fontsize=fontsize)
     return calculate_total_darkness(img)
 
 
+def read_glyph_darkness_tables(path=GLYPH_DARKNESS_PATH):
+    try:
+        with open(path, "rb") as fobj:
+            data = json.load(fobj)
+    except (OSError, ValueError):
+        # not written yet (or unreadable), so the glyphs just get rendered again
+        return {}
+    if data.get("version") != GLYPH_DARKNESS_VERSION:
+        return {}
+    return data["sizes"]
+
+
+def write_glyph_darkness_table(fontsize, table, path=GLYPH_DARKNESS_PATH):
+    # merge with what's on disk, in case other processes have added sizes or glyphs meanwhile
+    sizes = read_glyph_darkness_tables(path)
+    sizes[str(fontsize)] = dict(sizes.get(str(fontsize), {}), **table)
+    data = {"version": GLYPH_DARKNESS_VERSION, "sizes": sizes}
+    encoded = json.dumps(data, indent=2, sort_keys=True).encode("utf-8")
+    atomic_write(path, lambda fobj: fobj.write(encoded))
+
+
+def get_glyph_darkness_table(fontsize=14, glyphs=""):
+    """
+    Darkness of each glyph of the simulation font at the given size, rendered on its own. These
+    are measured once per font size (plus any glyphs not seen before), and persisted to
+    GLYPH_DARKNESS_PATH so they only ever need to be rendered once. If it can't be written (e.g.
+    on a read-only install), the table is only kept in memory, for this process.
+    """
+    table = _glyph_darkness_tables.get(fontsize)
+    if table is None:
+        table = read_glyph_darkness_tables().get(str(fontsize), {})
+        _glyph_darkness_tables[fontsize] = table
+        glyphs = COMMON_GLYPHS + glyphs
+    missing = set(glyphs) - set(table)
+    if missing:
+        table.update((glyph, render_simulated_darkness(glyph, fontsize)) for glyph in missing)
+        try:
+            write_glyph_darkness_table(fontsize, table)
+        except OSError:
+            pass
+    return table
+
+
+@lru_cache(maxsize=100000)
+def get_simulated_darkness(text, fontsize=14):
+    # the thresholded pixels of separate glyphs (almost) never touch, so the darkness of a word is
+    # the sum of that of its glyphs, to within ~1% of rendering the whole word
+    table = get_glyph_darkness_table(fontsize, glyphs=text)
+    return float(sum(table[glyph] for glyph in text))
+
+
 def get_simulated_darkness_with_height_calibration(text, text_height):
     sim_height = 0
     fontsize = 1
@@ -326,6 +793,32 @@ def get_avg_word_darkness(line, img):
     return np.mean(darknesses)
 
 
+def get_darkness_integral(img, threshold=0.7):
+    """
+    Enhances and thresholds the whole page once, the same way calculate_total_darkness does for a
+    single subimage, and returns the integral image of the number of dark channel values at each
+    pixel, so the darkness of any box can be looked up in constant time.
+    """
+    # both steps only depend on each value, so run them over all 256 values and apply as a lookup table
+    values = np.arange(256, dtype=np.uint8).reshape(1, -1)
+    is_dark = (1 - apply_brightness_contrast(values, 30, 40) / 255) >= threshold
+    dark = cv2.LUT(np.asarray(img, dtype=np.uint8), is_dark.astype(np.uint8))
+    if dark.ndim == 3:
+        dark = cv2.transform(dark, np.ones((1, dark.shape[2])))
+    return cv2.integral(dark, sdepth=cv2.CV_64F)
+
+
+def get_box_darkness(integral, boxes):
+    # total darkness within each box of a BoxArray, clipped to the page like slicing the image would be
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x1, y1, x2, y2 = [np.clip(values, 0, limit) for values, limit in zip(
+        np.trunc(boxes.coords).astype(int).T, (width, height, width, height)
+    )]
+    x2 = np.maximum(x1, x2)
+    y2 = np.maximum(y1, y2)
+    return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+
 def simulate_avg_word_darkness(line):
     darknesses = []
     for word in line.words:
@@ -334,12 +827,32 @@ def simulate_avg_word_darkness(line):
 
 
 def annotate_lines_with_font_weight(items, img):
-    for item in items:
-        for line in item.lines:
-            weight = get_avg_word_darkness(line, img) / simulate_avg_word_darkness(line)
-            if weight <= 0 or np.isnan(weight):
-                weight = None
-            line.fontweight = weight
+    lines = [line for item in items for line in item.lines]
+    words = [word for line in lines for word in line.words]
+    # a PreprocessedPage (see preprocessing.py) may already have the integral image
+    if hasattr(img, "darkness_integral"):
+        integral = img.darkness_integral
+    else:
+        integral = get_darkness_integral(img)
+
+    # the darkness of all the words on the page, trimmed vertically as in get_avg_word_darkness
+    coords = BoxArray.from_boxes(word.bounding_box for word in words).coords
+    heights = coords[:, 3] - coords[:, 1]
+    coords[:, 1] += 0.1 * heights
+    coords[:, 3] -= 0.1 * heights
+    darknesses = get_box_darkness(integral, BoxArray(coords))
+    simulated = np.array([get_simulated_darkness(word.text) for word in words])
+
+    # then average them over the words of each line
+    starts = np.cumsum([0] + [len(line.words) for line in lines])
+    for line, start, end in zip(lines, starts[:-1], starts[1:]):
+        if start == end:
+            line.fontweight = None
+            continue
+        weight = darknesses[start:end].mean() / simulated[start:end].mean()
+        if weight <= 0 or np.isnan(weight):
+            weight = None
+        line.fontweight = weight
 
 
 def get_categorical_color(index, colormap=plt.cm.Dark2):
@@ -353,6 +866,23 @@ def annotate_items_with_tab_levels_for_kicd(
     same_fontweight_threshold=0.25,
     print_debug_info=False,
 ):
+    for _item in iter_items_with_tab_levels_for_kicd(
+        all_items,
+        same_level_threshold=same_level_threshold,
+        same_fontweight_threshold=same_fontweight_threshold,
+        print_debug_info=print_debug_info,
+    ):
+        pass
+
+
+def iter_items_with_tab_levels_for_kicd(
+    all_items,
+    same_level_threshold=0.025,
+    same_fontweight_threshold=0.25,
+    print_debug_info=False,
+):
+    # each item's tab level only depends on the items before it, so items can be streamed through,
+    # and are yielded as soon as their tab level is set
 
     tabs = 0
     bullet_type = ""
@@ -477,6 +1007,7 @@ def annotate_items_with_tab_levels_for_kicd(
 
         # store the tab level onto the item for later use
         item.tabs = tabs
+        yield item
 
         if print_debug_info:
             print(
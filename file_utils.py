@@ -0,0 +1,59 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import os
+
+
+def get_page_file_path(ocr_path, suffix):
+    """
+        Generates the path of a file derived from a page's OCR data, stored next to it
+        Args:
+            ocr_path (str) path to <file_id>-<page_number>_ocr.json file
+            suffix (str) what goes after the page number, e.g. "_columns.json"
+        Returns str path to <file_id>-<page_number><suffix> file
+    """
+    base, _ext = os.path.splitext(ocr_path)
+    if base.endswith("_ocr"):
+        base = base[: -len("_ocr")]
+    return "{}{}".format(base, suffix)
+
+
+def atomic_write(path, write):
+    """
+        Writes a file under a temporary name first and then moves it into place, so that readers
+        (including other processes) never see a partially written file
+        Args:
+            path (str) path to write to
+            write (function) writes the contents to the binary file object it's given
+        Returns None
+    """
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(temp_path, "wb") as fobj:
+            write(fobj)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
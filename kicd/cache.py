@@ -0,0 +1,170 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import hashlib
+import json
+import os
+import pickle
+
+from file_utils import atomic_write, get_page_file_path
+
+
+# Version of the results stored in _extraction.pkl files; files with any other version are ignored,
+# so changing what a stage returns (or how) needs it to be incremented
+EXTRACTION_CACHE_VERSION = 1
+
+
+def get_extraction_cache_path(ocr_path):
+    """
+        Generates the path of the extraction cache file stored next to the OCR data
+        Args: ocr_path (str) path to <file_id>-<page_number>_ocr.json file
+        Returns str path to <file_id>-<page_number>_extraction.pkl file
+    """
+    return get_page_file_path(ocr_path, "_extraction.pkl")
+
+
+def get_page_key(page_data, image_path):
+    """
+        Generates the key for everything extracted from a page, which changes whenever the OCR data
+        or the page image does (e.g. when the image is rendered or rotated again at the same path)
+        Args:
+            page_data (dict) serialized OCR data for the page
+            image_path (str) path to the page image
+        Returns str key
+    """
+    try:
+        stat = os.stat(image_path)
+        image_version = [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        image_version = None
+    encoded = json.dumps([page_data, image_path, image_version], sort_keys=True).encode("utf-8")
+    return hashlib.md5(encoded).hexdigest()
+
+
+def get_stage_key(previous_key, stage, params):
+    """
+        Generates the key for the result of an extraction stage, from the key of the stage it
+        builds on and the parameters that affect it, so that changing a parameter invalidates
+        that stage and everything after it, but nothing before it
+        Args:
+            previous_key (str) key of the page or previous stage
+            stage (str) name of the stage
+            params (dict) parameters that affect the stage
+        Returns str key
+    """
+    encoded = json.dumps([previous_key, stage, EXTRACTION_CACHE_VERSION, params], sort_keys=True)
+    return hashlib.md5(encoded.encode("utf-8")).hexdigest()
+
+
+def run_stage(stages, stage, key, compute):
+    """
+        Returns the cached result of a stage if it was computed with the same key, and otherwise
+        computes it and caches it (replacing any result computed with an older key)
+        Args:
+            stages (dict) results for the page, as stage -> (key, result), or None to not cache
+            stage (str) name of the stage
+            key (str) key from get_stage_key
+            compute (function) computes the result of the stage
+        Returns result of the stage
+    """
+    if stages is not None and stages.get(stage, (None,))[0] == key:
+        return stages[stage][1]
+    result = compute()
+    if stages is not None:
+        stages[stage] = (key, result)
+    return result
+
+
+class ExtractionCache(object):
+    """
+        Keeps the latest result of each extraction stage (bullets, columns, items, font weights) for
+        each page, so re-running the extraction with different parameters only recomputes the stages
+        affected by them. If `persist` is set, results are stored next to the OCR data instead of in
+        memory, so they are kept between sessions and memory use stays bounded on long documents.
+    """
+
+    def __init__(self, persist=True):
+        self.persist = persist
+        self._pages = {}
+        self._paths = set()  # pages seen so far
+
+    def __getstate__(self):
+        # worker processes only need to know where pages are persisted, not what's been seen here
+        return {"persist": self.persist, "_pages": {}, "_paths": set()}
+
+    def track(self, ocr_path):
+        """
+            Records a page as seen (so that `clear` removes it), when another process reads and
+            writes its results
+            Args: ocr_path (str) path to the page's _ocr.json file
+            Returns None
+        """
+        self._paths.add(ocr_path)
+
+    def get_page(self, ocr_path):
+        """
+            Args: ocr_path (str) path to the page's _ocr.json file
+            Returns dict of stage -> (key, result) for the page
+        """
+        self._paths.add(ocr_path)
+        if not self.persist:
+            return self._pages.setdefault(ocr_path, {})
+        cache_path = get_extraction_cache_path(ocr_path)
+        if not os.path.exists(cache_path):
+            return {}
+        with open(cache_path, "rb") as fobj:
+            data = pickle.load(fobj)
+        if data.get("version") != EXTRACTION_CACHE_VERSION:
+            return {}
+        return data["stages"]
+
+    def set_page(self, ocr_path, stages):
+        """
+            Args:
+                ocr_path (str) path to the page's _ocr.json file
+                stages (dict) of stage -> (key, result) for the page
+            Returns None
+        """
+        self._paths.add(ocr_path)
+        if not self.persist:
+            self._pages[ocr_path] = stages
+        else:
+            cache_path = get_extraction_cache_path(ocr_path)
+            data = {"version": EXTRACTION_CACHE_VERSION, "stages": stages}
+            atomic_write(cache_path, lambda fobj: pickle.dump(data, fobj))
+
+    def clear(self, ocr_path=None):
+        """
+            Removes the cached results for a page, or for all the pages seen so far
+            Args: ocr_path (str) path to the page's _ocr.json file [optional]
+            Returns None
+        """
+        paths = [ocr_path] if ocr_path else list(self._paths)
+        for path in paths:
+            self._paths.discard(path)
+            self._pages.pop(path, None)
+            cache_path = get_extraction_cache_path(path)
+            if self.persist and os.path.exists(cache_path):
+                os.remove(cache_path)
@@ -23,61 +23,293 @@
 #
 ##################################################
 
+import collections
+import multiprocessing
+
 from scanner import CurriculumScanner
 from classes import *
 from extraction_utils import *
+from config import PAGE_CACHE_MAX_BYTES
+from kicd.cache import ExtractionCache, get_page_key, get_stage_key, run_stage
+from preprocessing import PageCache
 
 
-def extract_markdown_from_document(doc, start_page=0, end_page=None):
+# each worker process keeps its own cache of the pages it has worked on
+_worker_page_cache = None
+
+# parameters for extraction_utils.determine_column_bounding_boxes
+DEFAULT_COLUMN_PARAMS = {"smoothing_granularity": 8, "prominence": 1, "width": 50}
+
+
+def extract_page_items(
+    doc,
+    page_num,
+    search_margins_only=True,
+    bullet_engine="template",
+    column_params=DEFAULT_COLUMN_PARAMS,
+    page_cache=None,
+    stages=None,
+):
+    """
+    Runs the extraction steps that only need a single page: column detection, bullet detection,
+    splitting the columns into single line items, and estimating the font weight of each line.
+    If `stages` (the page's results from an ExtractionCache) is given, only the steps whose
+    inputs or parameters changed since they were cached are run again.
+    """
+
+    # "template" matches bullet images, "components" classifies blobs of ink (see BULLET_ENGINES)
+    get_bullets = BULLET_ENGINES[bullet_engine]
+
+    # the page image and its grayscale, binarized etc. versions, only loaded if they're needed
+    if page_cache is None:
+        page_cache = PageCache()
+    image_path = doc.pages[page_num]["image"]
+    get_page = lambda: page_cache.get(image_path, lambda: doc.get_page_array(page_num))
+    page_data = doc.get_page_data(page_num)
+
+    # parse the words out of the OCR data once, for all of the steps below
+    word_tables = []
+
+    def get_words():
+        if not word_tables:
+            word_tables.append(build_word_table(page_data))
+        return word_tables[0]
+
+    # blank pages (e.g. skipped by process_scan) have nothing to extract, not even bullets
+    if not len(get_words()):
+        return []
+
+    # each step's key builds on the previous one's, so a change invalidates everything after it
+    page_key = get_page_key(page_data, image_path)
+
+    # extract the columns (computed once per page and parameters, then served from disk)
+    columns_key = get_stage_key(page_key, "columns", column_params)
+    columns = run_stage(
+        stages,
+        "columns",
+        columns_key,
+        lambda: doc.get_column_boxes(
+            page_num, page_data=page_data, word_table=get_words(), **column_params
+        ),
+    )
+
+    # bullets only appear just left of the text, so only search those strips if requested (the
+    # lines' margins find them all, the columns' margins would double the area searched)
+    def find_bullets():
+        regions = get_bullet_search_regions(page_data) if search_margins_only else None
+        return get_bullets(get_page(), regions=regions)
+
+    bullets_key = get_stage_key(
+        columns_key,
+        "bullets",
+        {
+            "engine": bullet_engine,
+            "search_margins_only": search_margins_only,
+            "margins": "lines",
+        },
+    )
+    bullets = run_stage(stages, "bullets", bullets_key, find_bullets)
+
+    # extract the items by column
+    items_key = get_stage_key(bullets_key, "items", {})
+    items = run_stage(
+        stages,
+        "items",
+        items_key,
+        lambda: extract_items_by_column(get_words() + bullets, columns),
+    )
+
+    # annotate the lines with an estimate of their font weight, against this page's own image
+    def estimate_font_weights():
+        annotate_lines_with_font_weight(items, get_page())
+        return [line.fontweight for item in items for line in item.lines]
+
+    fontweights_key = get_stage_key(items_key, "fontweights", {})
+    fontweights = run_stage(stages, "fontweights", fontweights_key, estimate_font_weights)
+    for line, fontweight in zip([line for item in items for line in item.lines], fontweights):
+        line.fontweight = fontweight
+
+    return items
+
+
+def _initialize_worker(max_bytes):
+    global _worker_page_cache
+    _worker_page_cache = PageCache(max_bytes=max_bytes)
 
-    if not end_page:
-        end_page = len(doc.pages) - 1
 
-    all_items = ItemList([])
+def extract_cached_page_items(doc, page_num, cache=None, page_cache=None, **kwargs):
+    """
+    Extracts the items of a page (see extract_page_items), looking up the results of each step in
+    `cache` (an ExtractionCache) and writing them back if any step had to be rerun
+    """
+    if not cache:
+        return extract_page_items(doc, page_num, page_cache=page_cache, **kwargs)
+    ocr_path = doc.get_page_data_path(page_num)
+    stages = dict(cache.get_page(ocr_path))
+    cached_keys = _get_stage_keys(stages)
+    items = extract_page_items(doc, page_num, page_cache=page_cache, stages=stages, **kwargs)
+    # only write the pages that had steps rerun, i.e. with new keys
+    if _get_stage_keys(stages) != cached_keys:
+        cache.set_page(ocr_path, stages)
+    return items
 
-    for page_num in range(start_page, end_page + 1):
-        img = PageImage(doc.get_page_image(page_num))
-        page_data = doc.get_page_data(page_num)
 
-        bullets = get_bullets_by_template(img)
+def _get_stage_keys(stages):
+    return {stage: key for stage, (key, _result) in stages.items()}
 
-        # extract the columns
-        columns = determine_column_bounding_boxes(
-            page_data,
-            plot_density=False,
-            smoothing_granularity=8,
-            prominence=1,
-            width=50,
+
+def _extract_page_items_in_worker(args):
+    doc, page_num, kwargs, cache, stages = args
+    if stages is None:
+        # persisted caches are read and written by the worker itself, so results never go
+        # through the parent process
+        items = extract_cached_page_items(
+            doc, page_num, cache=cache, page_cache=_worker_page_cache, **kwargs
+        )
+    else:
+        items = extract_page_items(
+            doc, page_num, page_cache=_worker_page_cache, stages=stages, **kwargs
         )
+    return items, stages
+
 
-        # extract the items by column, and add onto our list
-        for column_box in columns:
-            items = extract_single_line_items_from_column(
-                page_data, column_box=column_box, bullets=bullets
+def extract_items_by_page(
+    doc, page_nums, processes=None, page_cache=None, cache=None, **kwargs
+):
+    """
+    Yields the items of each page (see extract_page_items), in order. Pages are independent of
+    each other, so they get spread over a pool of `processes` worker processes (all of the CPUs by
+    default). With a single process or page, they're extracted in this process, using `page_cache`.
+    Results of each step are looked up in and added to `cache` (an ExtractionCache), if given.
+    Only a couple of pages per worker are in flight at once, so memory use doesn't grow with the
+    length of the document.
+    """
+    page_nums = list(page_nums)
+
+    if processes is None:
+        processes = min(multiprocessing.cpu_count(), len(page_nums))
+    if processes <= 1:
+        for page_num in page_nums:
+            yield extract_cached_page_items(
+                doc, page_num, cache=cache, page_cache=page_cache, **kwargs
             )
-            all_items += items
+        return
 
-    # go through and combine items together that belong together
-    all_items = all_items.combine_lines()
+    def dispatch(pool, page_num):
+        stages = None
+        if cache and not cache.persist:
+            # in memory caches live in this process, so their results get sent to the workers
+            stages = dict(cache.get_page(doc.get_page_data_path(page_num)))
+            cache_keys[page_num] = _get_stage_keys(stages)
+        elif cache:
+            cache.track(doc.get_page_data_path(page_num))
+        args = (doc, page_num, kwargs, cache or None, stages)
+        return pool.apply_async(_extract_page_items_in_worker, (args,))
+
+    def collect(page_num, result):
+        items, stages = result.get()
+        if stages is not None and _get_stage_keys(stages) != cache_keys.pop(page_num):
+            cache.set_page(doc.get_page_data_path(page_num), stages)
+        return items
+
+    # keys of the stages each page had cached, for in memory caches
+    cache_keys = {}
+
+    # split the memory allowed for cached pages between the workers
+    max_bytes = (page_cache.max_bytes if page_cache else PAGE_CACHE_MAX_BYTES) // processes
+    with multiprocessing.Pool(
+        processes, initializer=_initialize_worker, initargs=(max_bytes,)
+    ) as pool:
+        # keep each worker busy with the next page, without running ahead of the caller
+        pending = collections.deque()
+        for page_num in page_nums:
+            pending.append((page_num, dispatch(pool, page_num)))
+            if len(pending) >= 2 * processes:
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
+
+
+def iter_items_from_document(
+    doc,
+    start_page=0,
+    end_page=None,
+    search_margins_only=True,
+    bullet_engine="template",
+    column_params=DEFAULT_COLUMN_PARAMS,
+    same_level_threshold=0.025,
+    same_fontweight_threshold=0.25,
+    page_cache=None,
+    cache=None,
+    processes=None,
+):
+    """
+    Yields the items of the document, with their tab levels set, as soon as the items after them
+    are known well enough to settle them (combining lines only needs to look one item ahead, and tab
+    levels only look back), so only a few pages worth of items are held in memory at once.
+    """
+
+    if not end_page:
+        end_page = len(doc.pages) - 1
+
+    # keep each page's intermediate results next to its OCR data, unless told not to cache
+    if cache is None:
+        cache = ExtractionCache()
+
+    # run the steps for each page in parallel, and stream the items of each page, in order
+    page_items = (
+        item
+        for items in extract_items_by_page(
+            doc,
+            range(start_page, end_page + 1),
+            processes=processes,
+            page_cache=page_cache,
+            cache=cache,
+            search_margins_only=search_margins_only,
+            bullet_engine=bullet_engine,
+            column_params=column_params,
+        )
+        for item in items
+    )
 
-    # annotate the lines with an estimate of their font weight
-    annotate_lines_with_font_weight(all_items, img)
+    # go through and combine items together that belong together
+    combined_items = combine_item_lines(page_items)
 
-    annotate_items_with_tab_levels_for_kicd(
-        all_items,
-        same_level_threshold=0.025,
-        same_fontweight_threshold=0.25,
+    yield from iter_items_with_tab_levels_for_kicd(
+        combined_items,
+        same_level_threshold=same_level_threshold,
+        same_fontweight_threshold=same_fontweight_threshold,
         print_debug_info=False,
     )
 
-    return all_items
+
+def extract_markdown_from_document(doc, start_page=0, end_page=None, **kwargs):
+    """
+    Extracts all of the items of the document (see iter_items_from_document for the arguments)
+    Returns ItemList of the items, with their tab levels set
+    """
+    return ItemList(
+        iter_items_from_document(doc, start_page=start_page, end_page=end_page, **kwargs)
+    )
+
+
+def write_markdown_from_document(doc, fobj, **kwargs):
+    """
+    Streams the markdown for the document into `fobj` (a text file opened for writing), item by
+    item, rather than holding the whole document in memory (see iter_items_from_document for the
+    other arguments)
+    """
+    for item in iter_items_from_document(doc, **kwargs):
+        fobj.write(render_item_to_markdown(item))
+
+
+def render_item_to_markdown(item):
+    parts = ["\t" * item.tabs, "- "]
+    if item.bullet and item.bullet.text not in ["-", "•"]:
+        parts.append(item.bullet.text + " ")
+    parts.append(item.get_text() + "\n")
+    return "".join(parts)
 
 
 def render_to_markdown(items):
-    text = ""
-    for item in items:
-        text += "\t" * item.tabs + "- "
-        if item.bullet and item.bullet.text not in ["-", "•"]:
-            text += item.bullet.text + " "
-        text += item.get_text() + "\n"
-    return text
+    return "".join(render_item_to_markdown(item) for item in items)
@@ -0,0 +1,122 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import ORIENTATION_ANALYSIS_SIZE, ORIENTATION_CONFIDENCE_THRESHOLD
+
+
+def binarize_for_orientation(image, max_size=ORIENTATION_ANALYSIS_SIZE):
+    """
+        Downscales a page so its longest side is at most `max_size`, and binarizes it
+        Args: image (PIL.Image or numpy array) page image
+        Returns numpy array with 1 where there's ink and 0 elsewhere
+    """
+    if isinstance(image, Image.Image):
+        image = np.array(image.convert("L"))
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    scale = max_size / max(image.shape[:2])
+    if scale < 1:
+        size = (max(1, int(image.shape[1] * scale)), max(1, int(image.shape[0] * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(image, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return binary
+
+
+def get_profile_sharpness(profile):
+    # text lines make the profile alternate between full and empty, which squared steps reward
+    profile = profile.astype(float)
+    return np.sum(np.diff(profile) ** 2) / max(np.sum(profile) ** 2 / len(profile), 1)
+
+
+def get_line_bands(binary):
+    """
+        Finds the horizontal text lines in a binarized page
+        Returns list of (start row, end row) tuples
+    """
+    rows = binary.sum(axis=1)
+    has_ink = rows > max(1, 0.02 * binary.shape[1])
+    edges = np.diff(np.concatenate([[0], has_ink.astype(np.int8), [0]]))
+    starts, = np.nonzero(edges == 1)
+    ends, = np.nonzero(edges == -1)
+    return [(start, end) for start, end in zip(starts, ends) if end - start >= 4]
+
+
+def get_upright_score(binary):
+    """
+        Scores how upright the horizontal text lines in a binarized page are, by comparing the ink
+        above each line's x-height band (ascenders and capitals) to the ink below it (descenders),
+        since Latin text has many more of the former
+        Returns (score, number of lines) where score is between -1 (upside down) and 1 (upright)
+    """
+    above = below = 0
+    lines = 0
+    for start, end in get_line_bands(binary):
+        profile = binary[start:end].sum(axis=1).astype(int)
+        core, = np.nonzero(profile >= 0.5 * profile.max())
+        if len(core) < 2:
+            continue
+        above += profile[: core[0]].sum()
+        below += profile[core[-1] + 1 :].sum()
+        lines += 1
+    if above + below == 0:
+        return 0.0, lines
+    return float(above - below) / (above + below), lines
+
+
+def estimate_orientation(image, threshold=ORIENTATION_CONFIDENCE_THRESHOLD, min_lines=3):
+    """
+        Estimates how a page is rotated from the image alone, using projection profiles of the
+        binarized page at a low resolution
+        Args:
+            image (PIL.Image or numpy array) page image
+            threshold (float) how clear both the line direction and the up/down cues need to be
+            min_lines (int) minimum number of text lines needed to decide
+        Returns degrees to rotate the page counter-clockwise by to straighten it (0, 90, 180 or
+            270, like process_scans.detect_orientation), or None if the page is ambiguous
+    """
+    binary = binarize_for_orientation(image)
+    if not binary.any():
+        return None
+
+    # text lines run along whichever axis has the sharper profile across it
+    horizontal = get_profile_sharpness(binary.sum(axis=1))
+    vertical = get_profile_sharpness(binary.sum(axis=0))
+    if max(horizontal, vertical) < (1 + threshold) * min(horizontal, vertical):
+        return None
+    if vertical > horizontal:
+        # turned so the lines are horizontal, in the same direction autocorrect_image would turn it
+        binary = np.rot90(binary)
+        rotations = (90, 270)
+    else:
+        rotations = (0, 180)
+
+    score, lines = get_upright_score(binary)
+    if lines < min_lines or abs(score) < threshold:
+        return None
+    return rotations[0] if score > 0 else rotations[1]
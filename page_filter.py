@@ -0,0 +1,150 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import BLANK_PAGE_MAX_INK
+from config import DUPLICATE_PAGE_ANALYSIS_SIZE
+from config import DUPLICATE_PAGE_MAX_DIFFERENCE
+from config import DUPLICATE_PAGE_MAX_HASH_DISTANCE
+
+
+def get_gray_page(image):
+    if isinstance(image, Image.Image):
+        return np.array(image.convert("L"))
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return image
+
+
+def get_ink_coverage(gray):
+    """ Returns the fraction of the page's pixels that are dark enough to be ink """
+    return np.count_nonzero(gray < 128) / float(gray.size)
+
+
+def get_perceptual_hash(gray, hash_size=16):
+    """
+        Difference hash of a page: whether each cell of a `hash_size` x `hash_size` grid is
+        brighter than the one to its right, which barely changes when a page is re-rendered
+        or re-scanned
+        Returns numpy array of `hash_size` * `hash_size` / 8 bytes
+    """
+    cells = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(cells[:, 1:] > cells[:, :-1])
+
+
+def get_hash_distance(first, second):
+    """ Returns the number of bits that differ between two perceptual hashes """
+    return int(np.unpackbits(np.bitwise_xor(first, second)).sum())
+
+
+def get_blank_page_data(width, height):
+    """
+        Builds the OCR data of a blank page, in the same format as process_scans writes for pages
+        that went through OCR, without running the Vision API on it
+        Returns dict of serialized OCR data with no blocks
+    """
+    page = {
+        "confidence": 0.0,
+        "height": height,
+        "width": width,
+        "property": {},
+        "blocks": [],
+        "text": "",
+    }
+    return {"text": "", "pages": [page]}
+
+
+class PageFilter(object):
+    """
+        Finds the pages of a scan that don't need to be sent to OCR: blank pages (almost no ink),
+        and pages that repeat a page already seen (e.g. separator or cover pages).
+
+        Pages are first matched by perceptual hash, which is cheap but can't tell apart different
+        pages with the same layout. Candidates are then compared ink pixel by ink pixel at a
+        reduced size, so only pages that are the same up to rendering noise count as duplicates.
+    """
+
+    def __init__(
+        self,
+        max_ink=BLANK_PAGE_MAX_INK,
+        max_hash_distance=DUPLICATE_PAGE_MAX_HASH_DISTANCE,
+        max_difference=DUPLICATE_PAGE_MAX_DIFFERENCE,
+        analysis_size=DUPLICATE_PAGE_ANALYSIS_SIZE,
+    ):
+        self.max_ink = max_ink
+        self.max_hash_distance = max_hash_distance
+        self.max_difference = max_difference
+        self.analysis_size = analysis_size
+        # (page key, hash, shape, packed ink mask, ink count) for each page that was kept
+        self._pages = []
+
+    def _get_ink_mask(self, gray):
+        scale = self.analysis_size / max(gray.shape[:2])
+        if scale < 1:
+            size = (max(1, int(gray.shape[1] * scale)), max(1, int(gray.shape[0] * scale)))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return gray < 128
+
+    def find_duplicate(self, gray):
+        """
+            Args: gray (numpy array) grayscale page image
+            Returns key of the already seen page this page repeats, or None
+        """
+        page_hash = get_perceptual_hash(gray)
+        mask = None
+        for key, other_hash, shape, other_mask, other_ink in self._pages:
+            if gray.shape != shape or get_hash_distance(page_hash, other_hash) > self.max_hash_distance:
+                continue
+            if mask is None:
+                mask = self._get_ink_mask(gray)
+                ink = np.count_nonzero(mask)
+            different = np.count_nonzero(mask != np.unpackbits(other_mask)[: mask.size].reshape(mask.shape))
+            if different <= self.max_difference * max(ink, other_ink, 1):
+                return key
+        return None
+
+    def check(self, image, key):
+        """
+            Checks whether a page needs OCR, remembering it as a page later ones could repeat if so
+            Args:
+                image (PIL.Image or numpy array) page image
+                key: identifies the page, e.g. its page number
+            Returns ("blank", None), ("duplicate", key of the repeated page), or (None, None) if the
+                page needs to be sent to OCR
+        """
+        gray = get_gray_page(image)
+        if get_ink_coverage(gray) <= self.max_ink:
+            return "blank", None
+        duplicate_of = self.find_duplicate(gray)
+        if duplicate_of is not None:
+            return "duplicate", duplicate_of
+        mask = self._get_ink_mask(gray)
+        self._pages.append(
+            (key, get_perceptual_hash(gray), gray.shape, np.packbits(mask), np.count_nonzero(mask))
+        )
+        return None, None
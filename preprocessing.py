@@ -0,0 +1,220 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+from collections import OrderedDict
+import glob
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import DECODED_IMAGE_CACHE_MAX_BYTES, PAGE_CACHE_MAX_BYTES
+from extraction_utils import get_darkness_integral
+from file_utils import atomic_write
+
+
+class PreprocessedPage(object):
+    """
+        A page image along with the transformed versions of it used by the extraction stages, each
+        computed lazily the first time it's needed, and then shared by all of the stages.
+        Attributes:
+            image: the page image, as a NumPy array
+            gray: grayscale image (converted as BGR, as the extraction code always has)
+            binary: 1 where there's ink and 0 elsewhere (Otsu thresholded), as uint8
+            binary_integral: integral image of `binary`
+            darkness_integral: integral image of how dark each pixel is once enhanced
+                (see extraction_utils.get_darkness_integral)
+    """
+
+    def __init__(self, image):
+        if isinstance(image, Image.Image):
+            image = np.array(image)
+        self.image = image
+        self._arrays = {}
+
+    def _get(self, name, compute):
+        if name not in self._arrays:
+            self._arrays[name] = compute()
+        return self._arrays[name]
+
+    @property
+    def gray(self):
+        return self._get(
+            "gray",
+            lambda: self.image if self.image.ndim == 2 else cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY),
+        )
+
+    @property
+    def binary(self):
+        def compute():
+            _, binary = cv2.threshold(self.gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+            return binary
+
+        return self._get("binary", compute)
+
+    @property
+    def binary_integral(self):
+        return self._get("binary_integral", lambda: cv2.integral(self.binary))
+
+    @property
+    def darkness_integral(self):
+        return self._get("darkness_integral", lambda: get_darkness_integral(self.image))
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes + sum(array.nbytes for array in self._arrays.values())
+
+
+class PageCache(object):
+    """
+        Keeps the most recently used PreprocessedPages, evicting the least recently used ones once
+        they take up more than `max_bytes` in total. Extraction moves forward through a book, so the
+        pages it's done with get evicted first.
+    """
+
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __contains__(self, key):
+        return key in self._pages
+
+    @property
+    def nbytes(self):
+        return sum(page.nbytes for page in self._pages.values())
+
+    def get(self, key, load_image):
+        """
+            Args:
+                key: identifies the page, e.g. the path to its image
+                load_image (function) returns the page image, if it isn't cached
+            Returns PreprocessedPage
+        """
+        if key in self._pages:
+            self._pages.move_to_end(key)
+        else:
+            self._pages[key] = PreprocessedPage(load_image())
+        # the arrays are computed after pages are returned, so sizes are only checked here
+        while len(self._pages) > 1 and self.nbytes > self.max_bytes:
+            self._pages.popitem(last=False)
+        return self._pages[key]
+
+    def clear(self):
+        self._pages.clear()
+
+
+# how each kind of decoded image is read from the original file; PIL gives RGB(A), OpenCV BGR
+IMAGE_READERS = {
+    "pil": lambda path: np.array(Image.open(path)),
+    "cv2": cv2.imread,
+}
+
+
+def get_decoded_image_paths(directory):
+    return glob.glob(os.path.join(directory, "**", "*_decoded_*.npy"), recursive=True)
+
+
+class DecodedImageCache(object):
+    """
+        Stores decoded page images as raw `.npy` arrays next to the image files, so that loading a
+        page again only memory-maps the array instead of decoding the PNG. Processes loading the
+        same page share the mapped file through the OS page cache. Once the decoded arrays of a
+        scan take up more than `max_bytes` on disk, the least recently loaded ones are deleted.
+
+        process_scan keeps each page in its own `<scan>/<page number>/` directory, so a scan's
+        arrays are the ones anywhere under the directory above the page's. Pass `directory` to
+        count them under a fixed directory instead, e.g. for images laid out some other way.
+    """
+
+    def __init__(self, max_bytes=DECODED_IMAGE_CACHE_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+
+    def get_scan_directory(self, image_path):
+        if self.directory is not None:
+            return self.directory
+        return os.path.dirname(os.path.dirname(os.path.abspath(image_path)))
+
+    @staticmethod
+    def get_decoded_path(image_path, reader="pil"):
+        filename, _ext = os.path.splitext(image_path)
+        return "{}_decoded_{}.npy".format(filename, reader)
+
+    def load(self, image_path, reader="pil"):
+        """
+            Args:
+                image_path (str) path to the page image
+                reader (str) how to decode the image if it isn't cached (see IMAGE_READERS)
+            Returns read-only NumPy array, memory-mapped from the decoded file
+        """
+        decoded_path = self.get_decoded_path(image_path, reader=reader)
+        if (
+            os.path.exists(decoded_path)
+            and os.path.getmtime(decoded_path) >= os.path.getmtime(image_path)
+        ):
+            # touched so that eviction knows it was used recently
+            os.utime(decoded_path)
+        else:
+            image = IMAGE_READERS[reader](image_path)
+            if image is None:
+                raise RuntimeError("Could not read image {}".format(image_path))
+            # other processes must never map a partially written file
+            atomic_write(decoded_path, lambda fobj: np.save(fobj, image))
+            self.evict(self.get_scan_directory(image_path), keep=decoded_path)
+        return np.load(decoded_path, mmap_mode="r")
+
+    def evict(self, directory, keep=None):
+        """
+            Deletes the least recently loaded decoded images anywhere under `directory` until
+            they take up at most `max_bytes`
+        """
+        paths = get_decoded_image_paths(directory)
+        stats = []
+        for path in paths:
+            try:
+                stats.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                # deleted by another process in the meantime
+                continue
+        total = sum(size for _mtime, size, _path in stats)
+        for _mtime, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self, directory):
+        """ Deletes all of the decoded images anywhere under `directory` """
+        for path in get_decoded_image_paths(directory):
+            os.remove(path)
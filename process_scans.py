@@ -42,17 +42,22 @@ from google.oauth2 import service_account
 # External library imports
 from progress.bar import Bar
 import numpy as np
-from PIL import Image, ImageDraw
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from PIL import Image
 
 
 # Project imports
+from annotation import render_annotations
+from annotation import vertices_to_polygons
+from columns import clear_column_layouts
+from columns import get_column_layout
+from columns import get_layout_key
+from orientation import estimate_orientation
+from page_filter import PageFilter, get_blank_page_data
 from pdf_reader import PDFParser
+from pyramid import generate_page_pyramid
 from config import ALLOWED_FORMATS
 from config import BLOCK_BORDER_THICKNESS
 from config import CREDENTIALS_PATH
-from config import COLUMN_DETECTION_THRESHOLD
 from config import INPUT_DIRECTORY
 from config import ORIENTATION_DETECTION_THRESHOLD
 from config import STRUCTURE
@@ -217,28 +222,32 @@ def detect_orientation(text_annotations):
       return 180
 
 
+# Exact (lossless) transposes for each right angle rotation, counter-clockwise like Image.rotate
+ROTATION_TRANSPOSES = {
+  90: Image.ROTATE_90,
+  180: Image.ROTATE_180,
+  270: Image.ROTATE_270,
+}
+
 def autocorrect_image(filepath):
   """
     Rotates image based on its detected orientation
       Args: filepath (str) path to image
-      Returns degrees of rotation (int)
+      Returns degrees of rotation (int), counter-clockwise
   """
   filename, _ext = os.path.splitext(os.path.basename(filepath))
   image = Image.open(filepath)
 
-  # Get Vision API data
-  response = get_text_detection(filepath, filename, suffix="original")
+  # Estimate the orientation from the image, only asking the Vision API if the page is ambiguous
+  orientation = estimate_orientation(image)
+  if orientation is None:
+    response = get_text_detection(filepath, filename, suffix="original")
+    orientation = detect_orientation(response.text_annotations)
 
   # Rotate and save the image if it's not properly oriented
-  orientation = detect_orientation(response.text_annotations)
   if orientation != 0:
-    rotated = image.rotate(orientation, expand=1)
-
-    # Straighten image
-    (w,h) = rotated.size
-    rotated = rotated.transform(rotated.size, Image.QUAD, (0,0,0,h,w,h,w,0))
-
-    rotated.save(filepath)
+    # Transposing only moves pixels around, so nothing gets resampled
+    image.transpose(ROTATION_TRANSPOSES[orientation]).save(filepath)
 
   return orientation
 
@@ -249,31 +258,6 @@ def autocorrect_image(filepath):
 #
 ###############################################################################
 
-def draw_bounding_box(image, bound, color="red", padding=0):
-  """
-    Draws a box given the bounding_box.vertices
-    Args:
-      image (PIL.Image) image to draw on
-      bound (google.cloud.vision bounding_box) vertices of rectangle
-      color (str) color of box [default: 'red']
-      padding (int) padding for drawn box
-    Returns None
-  """
-  draw = ImageDraw.Draw(image)
-  block_padding = padding * BLOCK_BORDER_THICKNESS
-  left_bottom_x = bound.vertices[0].x - block_padding
-  left_bottom_y = bound.vertices[0].y - block_padding
-  right_bottom_x =  bound.vertices[1].x + block_padding
-  right_bottom_y = bound.vertices[1].y - block_padding
-  right_top_x = bound.vertices[2].x + block_padding
-  right_top_y = bound.vertices[2].y + block_padding
-  left_top_x = bound.vertices[3].x - block_padding
-  left_top_y = bound.vertices[3].y + block_padding
-
-  draw.line([left_bottom_x, left_bottom_y, right_bottom_x, right_bottom_y, right_top_x,
-    right_top_y, left_top_x, left_top_y, left_bottom_x, left_bottom_y], fill=color, width=BLOCK_BORDER_THICKNESS)
-
-
 def draw_boxes_on_image(filepath, directory, pages):
   """
     Draws boxes on blocks, paragraphs, and words
@@ -289,18 +273,21 @@ def draw_boxes_on_image(filepath, directory, pages):
   """
   save_to_path = '{}_boxes.png'.format(directory)
   image = Image.open(filepath)
+
+  # Collect all the bounds first, so each color can be drawn in a single batch
+  words, paragraphs, blocks = [], [], []
   for page in pages:
     for block in page.blocks:
       for paragraph in block.paragraphs:
-        for word in paragraph.words:
-          # Draw words
-          draw_bounding_box(image, word.bounding_box, color="yellow")
-
-        # Draw paragraphs
-        draw_bounding_box(image, paragraph.bounding_box, color="blue", padding=1)
-
-      # Draw blocks
-      draw_bounding_box(image, block.bounding_box, padding=2)
+        words.extend(word.bounding_box for word in paragraph.words)
+        paragraphs.append(paragraph.bounding_box)
+      blocks.append(block.bounding_box)
+
+  image = render_annotations(image, [
+    (vertices_to_polygons(words), "yellow"),
+    (vertices_to_polygons(paragraphs, padding=BLOCK_BORDER_THICKNESS), "blue"),
+    (vertices_to_polygons(blocks, padding=2 * BLOCK_BORDER_THICKNESS), "red"),
+  ])
   image.save(save_to_path)
   return save_to_path
 
@@ -369,76 +356,6 @@ def convert_image_data_to_dict(item, structure):
   return data
 
 
-def detect_columns(filepath, image_data):
-  """
-    Detects how many columns are in the object based on the texts' bounding boxes
-    Args: image_data (google.cloud.vision.full_text_annotation) data to use for detection
-    Returns number of columns detected
-  """
-
-  # Set up variables for collecting info on image
-  mins = []
-  maxes = []
-  dataset = []
-
-  # Collect starting x values for each block
-  for page in image_data.full_text_annotation.pages:
-    for y, block in enumerate(page.blocks):
-      x0 = float(min([v.x for v in block.bounding_box.vertices]))
-      mins.append(x0)
-      maxes.append(max([v.x for v in block.bounding_box.vertices]))
-
-      # Append the point to the dataset for each paragraph to give
-      # it more weight, making sure that the point is unique as
-      # k-means needs the set of points and will remove duplicates
-      for i, paragraph in enumerate(block.paragraphs):
-        while (x0, 0) in dataset:
-          x0 += 0.5
-        dataset.append((x0, 0))
-
-  # If the page is blank, return empty array
-  if not dataset:
-    return []
-
-  # Get clustered points
-  max_width = max(maxes)
-  column_clusters = (1, [min(mins)])
-  if len(set(dataset)) > 2:
-    sil = []
-    for k in range(2, len(set(dataset))):
-      kmeans = KMeans(n_clusters = k).fit(dataset)
-      score = silhouette_score(dataset, kmeans.labels_, metric = 'correlation')
-      cluster_centers = [c[0] for c in kmeans.cluster_centers_]
-      sil.append((score, cluster_centers))
-    column_clusters = next(((i + 2, s[1]) for i, s in enumerate(sil) if s[0] > 0), column_clusters)
-
-  # Collect ranges based on boxes that fall into
-  ranges = []
-  if column_clusters[0] == 1:
-    ranges = [(column_clusters[1][0], max_width)]
-
-  else:
-    radius = (max_width / column_clusters[0]) / 2 + COLUMN_DETECTION_THRESHOLD
-    for starting_point in column_clusters[1]:
-      x_range = {}
-      for page in image_data.full_text_annotation.pages:
-        for block in page.blocks:
-          x0 = min([v.x for v in block.bounding_box.vertices])
-          x1 = max([v.x for v in block.bounding_box.vertices])
-          x_values = set(range(x0, x1))
-
-          # Get highest width of boxes that are within the radius of the starting point
-          if starting_point - radius <= x0 and x0 <= starting_point + radius \
-            and x1 - x0 <= max_width / column_clusters[0] :
-            x_range['x0'] = min(x0, x_range['x0']) if x_range.get('x0') else x0
-            x_range['x1'] = max(x1, x_range['x1']) if x_range.get('x1') else x1
-
-      if x_range:
-        ranges.append((x_range['x0'], x_range['x1']))
-
-  return ranges
-
-
 def write_text_fields(data):
   """
     Adds text field to data
@@ -488,19 +405,77 @@ def write_block_data(filepath, save_to_path):
   data = convert_image_data_to_dict(image_data, STRUCTURE)
   write_text_fields(data)
 
+  block_data = write_page_data(data, filepath, save_to_path)
+  block_data["boxes"] = draw_boxes_on_image(filepath, save_to_path, response.full_text_annotation.pages)
+  return block_data
+
+
+def write_page_data(data, filepath, save_to_path):
+  """
+    Writes serialized OCR data to a json file, along with its column layout
+    Args:
+      data (dict) serialized OCR data (see convert_image_data_to_dict)
+      filepath (str) path to the page image
+      save_to_path (str) path to save files to, without the suffix
+    Returns dict of metadata for the index.json file (except for "boxes")
+  """
+  block_file_path = '{}_ocr.json'.format(save_to_path)
+
   # Write the data to the file
   with open(block_file_path, 'wb') as fobj:
     fobj.write(json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
 
+  # Compute the column layout once and persist it next to the OCR data, so that
+  # later readers (CurriculumScanner, extraction) don't have to detect it again
+  clear_column_layouts(block_file_path)
+  columns = get_column_layout(block_file_path, "ranges", page_data=data)
+
   # Return metadata to be saved under index.json file
   return {
-    "columns": detect_columns(filepath, response),
+    "columns": columns,
+    "columns_key": get_layout_key("ranges", {}),
     "file": block_file_path,
     "image": filepath,
-    "boxes": draw_boxes_on_image(filepath, save_to_path, response.full_text_annotation.pages)
   }
 
 
+def write_blank_page_data(filepath, save_to_path):
+  """
+    Writes empty OCR data for a blank page, without running the Vision API on it
+    Args:
+      filepath (str) path to the page image
+      save_to_path (str) path to save files to, without the suffix
+    Returns dict of metadata for the index.json file
+  """
+  width, height = Image.open(filepath).size
+  block_data = write_page_data(get_blank_page_data(width, height), filepath, save_to_path)
+  block_data["boxes"] = draw_boxes_on_image(filepath, save_to_path, [])
+  return block_data
+
+
+def copy_page_data(original, filepath, save_to_path):
+  """
+    Reuses the OCR data of an earlier page for a page that repeats it, without running the
+    Vision API on it
+    Args:
+      original (dict) index.json metadata of the page being repeated
+      filepath (str) path to the page image
+      save_to_path (str) path to save files to, without the suffix
+    Returns dict of metadata for the index.json file
+  """
+  # Straighten the page the same way as the page it repeats, so the OCR bounds line up
+  if original["rotation"]:
+    Image.open(filepath).transpose(ROTATION_TRANSPOSES[original["rotation"]]).save(filepath)
+
+  with open(original["file"], 'rb') as fobj:
+    data = json.load(fobj)
+
+  block_data = write_page_data(data, filepath, save_to_path)
+  block_data["boxes"] = '{}_boxes.png'.format(save_to_path)
+  shutil.copyfile(original["boxes"], block_data["boxes"])
+  return block_data
+
+
 ###############################################################################
 #
 # MAIN PROCESSING FUNCTION
@@ -532,15 +507,24 @@ def process_scan(filepath):
       <filename>-<hash of file>
       -- index.json
       -- <filename>-<hash of file>-1.png
+      -- <filename>-<hash of file>-1_half.png
+      -- <filename>-<hash of file>-1_thumbnail.png
       -- <filename>-<hash of file>-1_ocr.json
+      -- <filename>-<hash of file>-1_columns.json
       -- <filename>-<hash of file>-2.png
       -- <filename>-<hash of file>-2_ocr.json
+      -- <filename>-<hash of file>-2_columns.json
 
     Where index.json stores the order of the pages as well as the following data:
       {
-        "columns": int,  # Number of columns detected
+        "columns": list,  # Column x ranges detected (also in _columns.json)
+        "columns_key": str, # Key the column x ranges are stored under in _columns.json
         "file": str,     # Path to json file with Google Vision API data
         "image": str,    # Path to image that was used to generate data
+        "pyramid": dict, # Paths to the image at each resolution (see PAGE_PYRAMID_SCALES)
+        "rotation": int, # Degrees the page image was rotated by (counter-clockwise) to straighten it
+        "skipped": str,  # Only for pages not sent to OCR: "blank" or "duplicate"
+        "duplicate_of": int, # Only for duplicate pages: index of the page whose OCR data was reused
       }
   """
 
@@ -581,19 +565,38 @@ def process_scan(filepath):
 
   # Generate json files for each image
   index_data = []
+  page_filter = PageFilter()
   bar = Bar('Writing page data', max=len(images))
   for index, image_path in enumerate(images):
-
-    # Step 3: Auto-rotate images based on detected orientation
-    autocorrect_image(image_path)
-
-    # Step 4: Write blocks data to json files and save bounding box images
     save_to_path = get_path(directory, index, '{}-{}'.format(file_id, index))
-    block_data = write_block_data(image_path, save_to_path)
+
+    # Blank pages and repeats of earlier pages don't need to be sent to the Vision API
+    skipped, duplicate_of = page_filter.check(Image.open(image_path), index)
+    if skipped == 'blank':
+      orientation = 0
+      block_data = write_blank_page_data(image_path, save_to_path)
+    elif skipped == 'duplicate':
+      orientation = index_data[duplicate_of]['rotation']
+      block_data = copy_page_data(index_data[duplicate_of], image_path, save_to_path)
+    else:
+      # Step 3: Auto-rotate images based on detected orientation
+      orientation = autocorrect_image(image_path)
+
+      # Step 4: Write blocks data to json files and save bounding box images
+      block_data = write_block_data(image_path, save_to_path)
+
+    # Save the reduced resolutions of the (rotated) page for previews and thumbnails
+    block_data['pyramid'] = generate_page_pyramid(image_path, overwrite=orientation != 0)
+    block_data['rotation'] = orientation
+    if skipped:
+      block_data['skipped'] = skipped
+    if duplicate_of is not None:
+      block_data['duplicate_of'] = duplicate_of
     index_data.append(block_data)
     bar.next()
 
   bar.finish()
+  print_skipped_pages(index_data)
 
   # Step 5: Write index.json file
   with open(os.path.sep.join([directory, 'index.json']), 'wb') as fobj:
@@ -602,6 +605,23 @@ def process_scan(filepath):
   return index_data
 
 
+def print_skipped_pages(index_data):
+  """
+    Prints which pages weren't sent to the Vision API, and why
+    Args: index_data (list) of index.json metadata for each page
+    Returns None
+  """
+  blank = [index for index, page in enumerate(index_data) if page.get('skipped') == 'blank']
+  duplicates = [
+    '{} (same as {})'.format(index, page['duplicate_of'])
+    for index, page in enumerate(index_data) if page.get('skipped') == 'duplicate'
+  ]
+  if blank:
+    print('Skipped {} blank page(s): {}'.format(len(blank), ', '.join(map(str, blank))))
+  if duplicates:
+    print('Reused OCR data for {} duplicate page(s): {}'.format(len(duplicates), ', '.join(duplicates)))
+
+
 def read_input_dir():
     if not os.path.exists(INPUT_DIRECTORY):
         print("Input directory doesn't exist: {}".format(INPUT_DIRECTORY))
@@ -0,0 +1,95 @@
+##################################################
+# MIT License
+#
+# Copyright (c) 2019 Learning Equality
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+##################################################
+
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import PAGE_PYRAMID_SCALES
+
+
+def get_pyramid_level_path(image_path, level):
+    """
+        Args:
+            image_path (str) path to the full resolution page image
+            level (str) name of the level (see PAGE_PYRAMID_SCALES)
+        Returns str path the level's image is saved at (the image itself for full resolution)
+    """
+    assert level in PAGE_PYRAMID_SCALES, "`level` must be one of {}".format(
+        ", ".join(PAGE_PYRAMID_SCALES)
+    )
+    if PAGE_PYRAMID_SCALES[level] == 1.0:
+        return image_path
+    filename, ext = os.path.splitext(image_path)
+    return "{}_{}{}".format(filename, level, ext)
+
+
+def get_pyramid_level_for_scale(scale):
+    """
+        Picks the smallest level that is still at least as big as `scale` (of the full resolution)
+        Returns (level name, level scale) tuple
+    """
+    levels = sorted(PAGE_PYRAMID_SCALES.items(), key=lambda level: level[1])
+    for level, level_scale in levels:
+        if level_scale >= scale:
+            return level, level_scale
+    return levels[-1]
+
+
+def generate_page_pyramid(image_path, overwrite=False):
+    """
+        Saves every (reduced) resolution of a page image, in a single pass from largest to smallest,
+        each level resized from the one above it rather than from the full image
+        Args:
+            image_path (str) path to the full resolution page image
+            overwrite (bool) regenerate levels that already exist, e.g. after the image was rotated
+        Returns dict of level name to image path
+    """
+    paths = {level: get_pyramid_level_path(image_path, level) for level in PAGE_PYRAMID_SCALES}
+    missing = [
+        level
+        for level, path in paths.items()
+        if path != image_path and (overwrite or not os.path.exists(path))
+    ]
+    if not missing:
+        return paths
+
+    image = Image.open(image_path)
+    if image.mode not in ("L", "RGB", "RGBA"):
+        # e.g. palette images, whose values can't be averaged when resizing
+        image = image.convert("RGB")
+    image = np.array(image)
+    height, width = image.shape[:2]
+    for level, scale in sorted(PAGE_PYRAMID_SCALES.items(), key=lambda level: -level[1]):
+        if scale == 1.0:
+            continue
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        # resizing from the previous level means only the first resize reads the full image
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        if level in missing:
+            Image.fromarray(image).save(paths[level])
+    return paths
@@ -28,13 +28,15 @@ import json
 import os
 import re
 
+import numpy as np
 from fuzzywuzzy import fuzz
+from annotation import group_results_by_page, render_annotations, render_contact_sheet, vertices_to_polygons
+from columns import get_column_layout, get_layout_key
 from process_scans import get_hash, process_scan
+from pyramid import generate_page_pyramid, get_pyramid_level_for_scale, get_pyramid_level_path
 from PIL import Image, ImageDraw
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 from config import StructureType
-from config import SEARCH_THRESHOLD, WRITE_DIRECTORY, BLOCK_BORDER_THICKNESS, COLUMN_DETECTION_THRESHOLD
+from config import SEARCH_THRESHOLD, WRITE_DIRECTORY, BLOCK_BORDER_THICKNESS
 
 # Google break type structures
 class BreakType(Enum):
@@ -65,16 +67,20 @@ class BlockOrder(Enum):
 
 class CurriculumScanner(object):
   pages = None  # List of pages based on index.json
+  decoded_images = None  # preprocessing.DecodedImageCache to load page images from, if any
 
 
-  def __init__(self, path):
+  def __init__(self, path, decoded_images=None):
     """
       Constructor for CurriculumScanner
 
       Args:
         path (str) to file to read from
+        decoded_images (preprocessing.DecodedImageCache) keeps decoded page images on disk,
+          so that get_page_array doesn't need to decode the image file each time
     """
     self.path = path
+    self.decoded_images = decoded_images
     file_id = get_hash(path)
     filename, _ext = os.path.splitext(os.path.basename(self.path))
     self.directory = "{}-{}".format(filename, file_id)
@@ -102,6 +108,17 @@ class CurriculumScanner(object):
     with open(index_path, 'rb') as fobj:
       return json.load(fobj)
 
+  def get_page_data_path(self, page_number):
+    """
+      Gets the path to the <file_id>-<page_number>_ocr.json file at a certain page number
+        Args: page_number (int) page to get path for
+        Returns str path to page data
+    """
+    filepath = self.pages[page_number]['file']
+    if not os.path.exists(filepath):
+      filepath = os.path.join(os.getcwd(), filepath)
+    return filepath
+
   def get_page_data(self, page_number):
     """
       Reads <file_id>-<page_number>.json file at a certain page number
@@ -109,22 +126,60 @@ class CurriculumScanner(object):
         Returns dict of page data
     """
 
-    filepath = self.pages[page_number]['file']
-    if not os.path.exists(filepath):
-      filepath = os.path.join(os.getcwd(), filepath)
+    filepath = self.get_page_data_path(page_number)
     with open(filepath, 'rb') as fobj:
       return json.load(fobj)
 
-  def get_page_image(self, page_number):
+  def get_page_image(self, page_number, level="full"):
     """
       Gets an image object for a certain page number
-        Args: page_number (int) page to get image for
+        Args:
+          page_number (int) page to get image for
+          level (str) resolution to get the page in (see PAGE_PYRAMID_SCALES) [default: 'full']
         Returns PIL.Image for page
     """
+    return Image.open(self.get_page_image_path(page_number, level=level))
+
+  def get_page_image_path(self, page_number, level="full"):
+    """
+      Gets the path to the image file at a certain page number, generating the reduced
+      resolutions if they haven't been yet (e.g. for scans processed before they existed)
+        Args:
+          page_number (int) page to get path for
+          level (str) resolution to get the page in (see PAGE_PYRAMID_SCALES) [default: 'full']
+        Returns str path to page image
+    """
     filepath = self.pages[page_number]['image']
     if not os.path.exists(filepath):
       filepath = os.path.join(os.getcwd(), filepath)
-    return Image.open(filepath)
+    level_path = get_pyramid_level_path(filepath, level)
+    if not os.path.exists(level_path):
+      level_path = generate_page_pyramid(filepath)[level]
+    return level_path
+
+  def get_page_array(self, page_number, level="full"):
+    """
+      Gets the pixels of a certain page number, memory-mapped from decoded_images if it's set
+        Args:
+          page_number (int) page to get pixels for
+          level (str) resolution to get the page in (see PAGE_PYRAMID_SCALES) [default: 'full']
+        Returns numpy.ndarray for page (same as numpy.array(get_page_image(page_number)))
+    """
+    if self.decoded_images is not None:
+      return self.decoded_images.load(self.get_page_image_path(page_number, level=level))
+    return np.array(self.get_page_image(page_number, level=level))
+
+  def get_page_image_for_scale(self, page_number, scale):
+    """
+      Gets the smallest saved resolution of a page that is at least `scale` times the full size
+        Args:
+          page_number (int) page to get image for
+          scale (float) fraction of the full resolution the image will be shown at
+        Returns (PIL.Image, float) tuple of the image and its scale relative to the full page,
+          which page coordinates need to be multiplied by to match the image
+    """
+    level, level_scale = get_pyramid_level_for_scale(scale)
+    return self.get_page_image(page_number, level=level), level_scale
 
 
   def get_next_page(self):
@@ -213,11 +268,12 @@ class CurriculumScanner(object):
     return image
 
 
-  def draw_boxes(self, page_number):
+  def draw_boxes(self, page_number, scale=1.0):
     """
       Draws boxes on blocks, paragraphs, and words
       Args:
         page_number (int) page to draw boxes on
+        scale (float) factor to downscale the page by before drawing [default: 1.0]
       Returns PIL.Image object with boxes drawn on it
 
       Blocks = red
@@ -225,21 +281,41 @@ class CurriculumScanner(object):
       Words = yellow
     """
     page_data = self.get_page_data(page_number)
-    image = self.get_page_image(page_number)
+    image, level_scale = self.get_page_image_for_scale(page_number, scale)
+
+    # Collect all the bounds first, so each color can be drawn in a single batch
+    words, paragraphs, blocks = [], [], []
     for page in page_data['pages']:
       for block in page['blocks']:
         for paragraph in block['paragraphs']:
-          for word in paragraph['words']:
-            # Draw words
-            self.draw_box(image, word['bounding_box'], color="yellow")
-
-          # Draw paragraphs
-          self.draw_box(image, paragraph['bounding_box'], color="blue", padding=1)
-
-        # Draw blocks
-        self.draw_box(image, block['bounding_box'], padding=2)
-
-    return image
+          words.extend(word['bounding_box'] for word in paragraph['words'])
+          paragraphs.append(paragraph['bounding_box'])
+        blocks.append(block['bounding_box'])
+
+    # the polygons are scaled to the saved resolution, which is then downscaled the rest of the way
+    return render_annotations(image, [
+      (vertices_to_polygons(words) * level_scale, "yellow"),
+      (vertices_to_polygons(paragraphs, padding=BLOCK_BORDER_THICKNESS) * level_scale, "blue"),
+      (vertices_to_polygons(blocks, padding=2 * BLOCK_BORDER_THICKNESS) * level_scale, "red"),
+    ], scale=scale / level_scale)
+
+  def draw_search_results(self, results, scale=0.25, color="yellow", columns=4):
+    """
+      Draws search results onto thumbnails of their pages, laid out on a contact sheet
+      Args:
+        results (list) matches from find_text_matches or find_regex_matches
+        scale (float) factor to downscale each page by [default: 0.25]
+        color (str) color of the result boxes [default: 'yellow']
+        columns (int) number of thumbnails per row on the sheet [default: 4]
+      Returns PIL.Image of the contact sheet (None if there are no results)
+    """
+    thumbnails = []
+    for page_number, polygons in group_results_by_page(results).items():
+      image, level_scale = self.get_page_image_for_scale(page_number, scale)
+      thumbnails.append(
+        render_annotations(image, [(polygons * level_scale, color)], scale=scale / level_scale)
+      )
+    return render_contact_sheet(thumbnails, columns=columns)
 
 
   def find_text_matches(self, text, fuzzy=False, search_threshold=SEARCH_THRESHOLD):
@@ -350,69 +426,34 @@ class CurriculumScanner(object):
 
   def detect_columns(self, page_number):
     """
-      Detects how many columns are in the object based on the texts' bounding boxes
+      Gets the column x ranges for a page, as detected when the scan was processed
       Args: page_number (int) page to detect columns on
       Returns list of column x ranges
     """
-
-    # Set up variables for collecting info on image
-    mins = []
-    maxes = []
-    dataset = []
-    image_data = self.get_page_data(page_number)
-
-    # Collect starting x values for each block
-    for page in image_data['pages']:
-      for y, block in enumerate(page['blocks']):
-        x0 = float(min([v['x'] for v in block['bounding_box']['vertices']]))
-        mins.append(x0)
-        maxes.append(max([v['x'] for v in block['bounding_box']['vertices']]))
-
-        # Append the point to the dataset for each paragraph to give
-        # it more weight, making sure that the point is unique as
-        # k-means needs the set of points and will remove duplicates
-        for i, paragraph in enumerate(block['paragraphs']):
-          while (x0, 0) in dataset:
-            x0 += 0.5
-          dataset.append((x0, 0))
-
-    # Get clustered points
-    max_width = max(maxes)
-    column_clusters = (1, [min(mins)])
-    if len(set(dataset)) > 2:
-      sil = []
-      for k in range(2, len(set(dataset))):
-        kmeans = KMeans(n_clusters = k).fit(dataset)
-        score = silhouette_score(dataset, kmeans.labels_, metric = 'correlation')
-        cluster_centers = [c[0] for c in kmeans.cluster_centers_]
-        sil.append((score, cluster_centers))
-      column_clusters = next(((i + 2, s[1]) for i, s in enumerate(sil) if s[0] > 0), column_clusters)
-
-    # Collect ranges based on boxes that fall into
-    ranges = []
-    if column_clusters[0] == 1:
-      ranges = [(column_clusters[1][0], max_width)]
-
-    else:
-      radius = (max_width / column_clusters[0]) / 2 + COLUMN_DETECTION_THRESHOLD
-      for starting_point in column_clusters[1]:
-        x_range = {}
-        for page in image_data['pages']:
-          for block in page.blocks:
-            x0 = min([v['x'] for v in block['bounding_box']['vertices']])
-            x1 = max([v['x'] for v in block['bounding_box']['vertices']])
-            x_values = set(range(x0, x1))
-
-            # Get highest width of boxes that are within the radius of the starting point
-            if starting_point - radius <= x0 and x0 <= starting_point + radius \
-              and x1 - x0 <= max_width / column_clusters[0] :
-              x_range['x0'] = min(x0, x_range['x0']) if x_range.get('x0') else x0
-              x_range['x1'] = max(x1, x_range['x1']) if x_range.get('x1') else x1
-
-        if x_range:
-          ranges.append((x_range['x0'], x_range['x1']))
-
-    return ranges
+    # Only reuse the ranges in index.json if they were detected with the current parameters
+    page = self.pages[page_number]
+    precomputed = None
+    if page.get('columns_key') == get_layout_key("ranges", {}):
+      precomputed = page.get('columns')
+    return get_column_layout(self.get_page_data_path(page_number), "ranges", precomputed=precomputed)
+
+  def get_column_boxes(self, page_number, page_data=None, word_table=None, **kwargs):
+    """
+      Gets the column bounding boxes for a page, computing them only once per set of parameters
+      Args:
+        page_number (int) page to get columns for
+        page_data (dict) already loaded page data, to avoid reading it again [optional]
+        word_table (WordTable) already built words of the page, to avoid parsing them again [optional]
+        kwargs: parameters for extraction_utils.determine_column_bounding_boxes
+      Returns BoundingBoxSet of column boxes
+    """
+    return get_column_layout(
+      self.get_page_data_path(page_number),
+      "boxes",
+      page_data=page_data,
+      word_table=word_table,
+      **kwargs
+    )
 
 
   def rearrange_multi_column_text_blocks(self, page_num, column_starts, dimension='x'):